@@ -0,0 +1,123 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from utils.scenario_analysis import cross_basis_scenarios, CROSS_BASIS_EPS_RANGE, CROSS_BASIS_PE_RANGE, RATE_CHANGE_RANGE_BPS
+from utils.grids import to_percent
+from utils.compact import compact_scenarios, memory_report
+
+
+def build_synthetic_universe(n_benchmarks=200, seed=0, n_dates=1, horizons=()):
+    """
+    Build a synthetic input frame with the same eps/pe/rate layout as data/sample_indices.csv.
+    `n_dates` business days per benchmark (benchmark-major); `horizons` (years)
+    adds the matching pe_{type}_avg/std_{h}y columns.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = n_benchmarks * n_dates
+    dates = pd.bdate_range(end="2025-08-05", periods=n_dates).strftime("%Y-%m-%d")
+    data = {
+        "date": np.tile(dates, n_benchmarks),
+        "benchmark_id": np.repeat([f"Index {i:05d}" for i in range(n_benchmarks)], n_dates),
+        "current_interest_rate": rng.uniform(0.5, 6.0, n_rows).round(2),
+    }
+    for basis in ["trailing", "fwd_1y", "fwd_2y"]:
+        data[f"eps_{basis}"] = rng.uniform(5.0, 400.0, n_rows).round(2)
+        data[f"pe_{basis}"] = rng.uniform(8.0, 35.0, n_rows).round(2)
+    for basis in ["trailing", "fwd_1y", "fwd_2y"]:
+        for h in horizons:
+            data[f"pe_{basis}_avg_{h}y"] = (data[f"pe_{basis}"] * rng.uniform(0.8, 1.2, n_rows)).round(2)
+            data[f"pe_{basis}_std_{h}y"] = rng.uniform(0.5, 3.0, n_rows).round(2)
+    return pd.DataFrame(data)
+
+
+def rowwise_cross_basis_with_rates(df):
+    """
+    Reference implementation: the original nested-loop, dict-per-cell generator.
+    Kept here only to measure the speedup of the vectorized engine.
+    """
+    scenarios = []
+    for _, row in df.iterrows():
+        benchmark = row.get("benchmark_id")
+        current_rate = row.get("current_interest_rate")
+        if pd.isna(current_rate):
+            continue
+        for basis in ["trailing", "fwd_1y", "fwd_2y"]:
+            eps = row.get(f"eps_{basis}")
+            pe = row.get(f"pe_{basis}")
+            if pd.isna(eps) or pd.isna(pe) or eps <= 0 or pe <= 0:
+                continue
+            base_price = eps * pe
+            for eps_chg in CROSS_BASIS_EPS_RANGE:
+                for pe_chg in CROSS_BASIS_PE_RANGE:
+                    for rate_chg in RATE_CHANGE_RANGE_BPS:
+                        adj_eps = eps * (1 + eps_chg)
+                        adj_pe = pe * (1 + pe_chg)
+                        implied_price = adj_eps * adj_pe
+                        implied_return = (implied_price / base_price) - 1
+                        scenarios.append({
+                            "Benchmark": benchmark,
+                            "EPS Type": basis,
+                            "PE Type": basis,
+                            "EPS Change (%)": to_percent(eps_chg),
+                            "PE Change (%)": to_percent(pe_chg),
+                            "Interest Rate Change (bps)": rate_chg,
+                            "Adjusted EPS": adj_eps,
+                            "Adjusted PE": adj_pe,
+                            "Adjusted Interest Rate": current_rate + rate_chg / 100.0,
+                            "Implied Index Level": implied_price,
+                            "Implied Return (%)": implied_return * 100,
+                            "Current EPS": eps,
+                            "Current PE": pe,
+                            "Current Index Level": base_price,
+                            "Current Interest Rate": current_rate
+                        })
+    return pd.DataFrame(scenarios)
+
+
+def time_call(func, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(n_benchmarks=200, repeat=3):
+    df = build_synthetic_universe(n_benchmarks)
+
+    t_rowwise, expected = time_call(rowwise_cross_basis_with_rates, df, repeat=1)
+    t_vector, actual = time_call(
+        lambda frame: cross_basis_scenarios(frame, rate_grid=RATE_CHANGE_RANGE_BPS), df, repeat=repeat
+    )
+
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=True)
+
+    print(f"Benchmarks: {n_benchmarks:,}  Rows: {len(actual):,}")
+    print(f"Row-wise:   {t_rowwise:8.3f}s")
+    print(f"Vectorized: {t_vector:8.3f}s")
+    print(f"Speedup:    {t_rowwise / t_vector:8.1f}x")
+
+
+def run_memory_report(n_benchmarks=200):
+    df = cross_basis_scenarios(build_synthetic_universe(n_benchmarks), rate_grid=RATE_CHANGE_RANGE_BPS)
+    fact, meta = compact_scenarios(df)
+    report = memory_report(df, fact, meta)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the cross-basis scenario generators.")
+    parser.add_argument("--benchmarks", type=int, default=200, help="Number of synthetic benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repeats for the vectorized engine")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Compare the current and compact scenario schemas instead of timing")
+    args = parser.parse_args()
+    if args.memory_report:
+        run_memory_report(args.benchmarks)
+    else:
+        run(args.benchmarks, args.repeat)
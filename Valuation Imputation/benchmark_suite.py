@@ -0,0 +1,183 @@
+import io
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from benchmark_scenarios import build_synthetic_universe
+from utils.aliases import rename_columns
+from utils.io import load_data, ChunkWriter
+from utils.scenario_analysis import (
+    cross_basis_scenarios,
+    generate_cross_basis_scenarios,
+    generate_cross_basis_scenarios_with_rates,
+    combined_long_format,
+    RATE_CHANGE_RANGE_BPS
+)
+from utils.transform import generate_stacked_pe_sensitivity, melt_pe_eps
+from utils.valuation_diagnostics import compute_pe_z_scores
+from utils.monte_carlo import monte_carlo_summary
+
+HORIZONS = [1, 3, 5, 7, 10, 15, 20]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def measure(name, func, rows_in, repeat=3):
+    """
+    Best-of-`repeat` wall time, then one extra run under tracemalloc for peak memory.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    rows_out = _rows(result)
+    del result
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    record = {
+        "name": name,
+        "seconds": best,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "rows_in_per_sec": rows_in / best if best else None,
+        "rows_out_per_sec": rows_out / best if rows_out is not None and best else None,
+        "peak_mb": peak / 2**20,
+    }
+    print(f"{name:<50} {best:9.4f}s  {record['peak_mb']:9.1f} MB  rows out: {rows_out if rows_out is not None else '-'}")
+    return record
+
+
+def build_cases(n_benchmarks, n_dates, horizons, workdir):
+    """
+    (name, callable, rows_in) for every public function under test, all on the same synthetic universe.
+    """
+    df = build_synthetic_universe(n_benchmarks, n_dates=n_dates, horizons=horizons)
+    df["date"] = pd.to_datetime(df["date"])
+    df_clean = rename_columns(df)
+    n = len(df)
+    # The per-row wrappers are only timed on a small slice; they exist for compatibility
+    head = df.head(min(n, 10))
+
+    csv_input = workdir / "input.csv"
+    df.to_csv(csv_input, index=False)
+    projection = ["date", "benchmark_id", "eps_trailing", "pe_trailing"]
+
+    scenarios = cross_basis_scenarios(df.head(min(n, 20)), rate_grid=RATE_CHANGE_RANGE_BPS)
+
+    def write(fmt):
+        def run():
+            with ChunkWriter(workdir / f"out.{fmt}", fmt) as writer:
+                writer.write(scenarios)
+            return scenarios
+        return run
+
+    cases = [
+        ("cross_basis_scenarios", lambda: cross_basis_scenarios(df), n),
+        ("cross_basis_scenarios[rates]", lambda: cross_basis_scenarios(df, rate_grid=RATE_CHANGE_RANGE_BPS), n),
+        ("generate_cross_basis_scenarios[row x10]",
+         lambda: [s for _, row in head.iterrows() for s in generate_cross_basis_scenarios(row)], len(head)),
+        ("generate_cross_basis_scenarios_with_rates[row x10]",
+         lambda: [s for _, row in head.iterrows() for s in generate_cross_basis_scenarios_with_rates(row)], len(head)),
+        ("combined_long_format", lambda: combined_long_format(df, "trailing"), n),
+        ("generate_stacked_pe_sensitivity", lambda: generate_stacked_pe_sensitivity(df_clean), n),
+        ("monte_carlo_summary[10k paths]", lambda: monte_carlo_summary(df, paths=10_000), n),
+        ("compute_pe_z_scores", lambda: compute_pe_z_scores(df), n),
+        ("melt_pe_eps", lambda: melt_pe_eps(df_clean), n),
+        ("load_data[csv]", lambda: load_data(csv_input), n),
+        ("load_data[csv, projected]", lambda: load_data(csv_input, columns=projection), n),
+        ("write[csv]", write("csv"), len(scenarios)),
+        ("to_csv[in-memory]", lambda: scenarios.to_csv(io.StringIO(), index=False) or scenarios, len(scenarios)),
+    ]
+    try:
+        import pyarrow  # noqa: F401
+        cases.append(("write[parquet]", write("parquet"), len(scenarios)))
+    except ImportError:
+        pass
+    return cases
+
+
+def run_suite(n_benchmarks, n_dates, horizons, repeat=3, only=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = build_cases(n_benchmarks, n_dates, horizons, Path(tmp))
+        records = [measure(name, func, rows, repeat) for name, func, rows in cases if not only or name in only]
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "universe": {"benchmarks": n_benchmarks, "dates": n_dates, "horizons": list(horizons)},
+        "results": records,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Print the change in time and peak memory per function versus a previous
+    results file. Returns the names that got slower or heavier by more than
+    `threshold` (0.2 = 20%).
+    """
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"\nvs {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for record in current["results"]:
+        old = previous.get(record["name"])
+        if old is None:
+            continue
+        time_ratio = record["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        mem_ratio = record["peak_mb"] / old["peak_mb"] if old["peak_mb"] else float("inf")
+        flag = ""
+        if time_ratio > 1 + threshold or mem_ratio > 1 + threshold:
+            regressions.append(record["name"])
+            flag = "  <-- REGRESSION"
+        print(f"{record['name']:<50} time x{time_ratio:6.2f}  memory x{mem_ratio:6.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark scenario generators, transforms and I/O.")
+    parser.add_argument("--benchmarks", type=int, default=500, help="Benchmarks in the synthetic universe")
+    parser.add_argument("--dates", type=int, default=1, help="Dates per benchmark")
+    parser.add_argument("--horizons", type=int, nargs="*", default=HORIZONS, help="P/E stat horizons in years")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repeats (best time is kept)")
+    parser.add_argument("--only", nargs="*", help="Only run the named benchmarks")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Previous JSON results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    results = run_suite(args.benchmarks, args.dates, args.horizons, args.repeat, args.only)
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), results, args.threshold)
+        if regressions:
+            raise SystemExit(f"Regressions: {', '.join(regressions)}")
@@ -0,0 +1,55 @@
+import logging
+import argparse
+from pathlib import Path
+
+from config import DATA_DIR, PE_STATS_STATE_PATH
+from utils.io import load_data
+from utils.pe_stats import KEY_COLUMNS, rolling_pe_stats, history_tail, append_pe_stats, stat_columns
+from utils.valuation_diagnostics import PE_TYPES
+
+
+def _save(df, path):
+    # The tail can be millions of rows; a .parquet state path is much faster to reload than CSV
+    if str(path).lower().endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def build(history_path, output_path, state_path):
+    """
+    Full rebuild: stats for every row of the history, plus the tail state for later appends.
+    """
+    history = load_data(history_path, columns=KEY_COLUMNS + PE_TYPES)
+    stats = rolling_pe_stats(history)
+    stats.to_csv(output_path, index=False)
+    _save(history_tail(history), state_path)
+    logging.info(f"Wrote {len(stats):,} rows × {len(stat_columns())} stat columns to {output_path}")
+
+
+def append(new_path, output_path, state_path):
+    """
+    Incremental update: stats for the new days only, appended to `output_path`.
+    """
+    if not Path(state_path).exists():
+        raise FileNotFoundError(f"No history tail at {state_path}; run a full build first")
+    tail = load_data(state_path, columns=KEY_COLUMNS + PE_TYPES)
+    stats, tail = append_pe_stats(tail, load_data(new_path, columns=KEY_COLUMNS + PE_TYPES))
+    stats.to_csv(output_path, mode="a", header=not Path(output_path).exists(), index=False)
+    _save(tail, state_path)
+    logging.info(f"Appended {len(stats):,} rows to {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the pe_{type}_{avg,std}_{h}y columns from a daily P/E history panel."
+    )
+    parser.add_argument("history", help="History file with benchmark_id, date and the pe_* columns")
+    parser.add_argument("--output", default=DATA_DIR / "pe_stats.csv", help="Stats CSV, keyed by benchmark_id and date")
+    parser.add_argument("--state", default=PE_STATS_STATE_PATH, help="History tail kept between appends")
+    parser.add_argument("--append", action="store_true",
+                        help="`history` holds only new days; extend the stats from the saved tail")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    (append if args.append else build)(args.history, args.output, args.state)
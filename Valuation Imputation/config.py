@@ -1,6 +1,57 @@
 from pathlib import Path
-DATA_DIR = Path("data")
-OUTPUT_DIR = Path("output")
-SUPPORTED_FORMATS = [".csv", ".xlsx", ".xls", ".parquet"]
+BASE_DIR = Path(__file__).resolve().parent  # relative paths below are anchored here, not to the working directory
+DATA_DIR = BASE_DIR / "data"
+OUTPUT_DIR = BASE_DIR / "output"  # main.py --output-dir overrides
+SUPPORTED_FORMATS = [".csv", ".xlsx", ".xls", ".parquet", ".feather"]
 USE_EXTERNAL_MAPPING = False
-MAPPING_PATH = "column_aliases.csv"
+MAPPING_PATH = BASE_DIR / "column_aliases.csv"
+SCENARIO_CHUNK_SIZE = 500  # benchmarks per streamed cross-basis batch
+OUTPUT_FORMAT = "csv"  # "csv", "parquet" or "feather"
+CATEGORICAL_COLUMNS = ["Benchmark", "EPS Type", "PE Type", "PE_Type", "MetricType", "Metric", "Scenario"]
+PARTITION_COLUMNS = ["Benchmark", "EPS Type"]  # Parquet partition keys for the large scenario tables
+WORKERS = 1  # default process-pool size for main.py (--workers overrides)
+PANEL_IMPACT = False  # anchor price impact per benchmark (date × benchmark panels) instead of to the first row
+RETURN_WINDOW = None  # observations for Rolling_Return_{n} in panel mode, e.g. 21 for ~1 month of trading days
+MANIFEST_PATH = BASE_DIR / "output_manifest.csv"  # row fingerprints of the last run, used by --incremental
+SCENARIO_CACHE_SIZE = 256  # in-memory LRU entries for the scenario table generators (0 disables)
+SCENARIO_CACHE_DIR = None  # e.g. BASE_DIR / ".scenario_cache" to also persist cached tables on disk
+COMPACT_OUTPUT = False  # write scenario tables in the compact schema (see utils/compact.py) plus *_meta side tables
+SENSITIVITY_BASES = ["trailing"]  # valuation bases for the P/E sensitivity tables, e.g. ["trailing", "fwd_1y", "fwd_2y"]
+CSV_ENGINE = "auto"  # CSV parser for load_data: "pyarrow", "c", or "auto" (pyarrow when installed)
+INPUT_CHUNK_SIZE = 100_000  # input rows per chunk for main.py --chunked
+RUN_REPORT_PATH = BASE_DIR / "run_report.json"  # per-stage timing report written by main.py; a .csv path writes CSV
+PROFILE_MEMORY = False  # trace peak memory per stage with tracemalloc (slows allocation-heavy stages)
+PROFILE_STAGES = []  # stages to run under cProfile, e.g. ["sensitivity", "basis"] (--profile overrides)
+PROFILE_DIR = BASE_DIR / "profiles"  # where cProfile stats (<stage>.prof) are written
+STAR_SCHEMA_OUTPUT = False  # write the Power BI star schema (dim_*/fact_* tables, see utils/star_schema.py) instead of the long, z-score, sensitivity and cross-basis tables
+CUBE_OUTPUT = False  # also write the cross-basis grids as dense memory-mappable cubes (output/<name>.cube/, see utils/cube.py)
+# Scenario grids as integer (start, stop, step, unit); unit "pct" = percent change, "bps" = basis points,
+# "pe" = P/E points. Trim or densify per product here; see utils/grids.py.
+GRID_SPECS = {
+    "cross_basis_eps": (-50, 50, 10, "pct"),  # EPS shocks in the cross-basis grids
+    "cross_basis_pe": (-50, 50, 10, "pct"),  # P/E shocks in the cross-basis grids
+    "rate_bps": (-200, 200, 25, "bps"),  # interest-rate shocks
+    "pe_table": (-20, 20, 5, "pct"),  # scenario_{basis}_pe_pct / _pe_abs
+    "eps_table": (-20, 20, 5, "pct"),  # scenario_{basis}_eps_scenarios
+    "combined_eps": (-20, 20, 10, "pct"),  # scenario_{basis}_combined, EPS axis
+    "combined_pe": (-20, 20, 10, "pct"),  # scenario_{basis}_combined, P/E axis
+    "pe_sensitivity": (-50, 50, 1, "pe"),  # P/E points around int(current P/E) in the sensitivity tables
+}
+MONTE_CARLO_OUTPUT = False  # also write monte_carlo_summary, simulated return distributions (see utils/monte_carlo.py)
+MC_PATHS = 100_000  # simulated paths per benchmark and date
+MC_BLOCK_SIZE = 1_000_000  # paths simulated per block (benchmarks × paths); bounds the shock arrays in memory
+MC_SEED = 0  # base seed; each benchmark/date draws from its own stream derived from it
+# One-period shocks as (mean, std): log EPS growth, log P/E change and interest-rate change in bps
+MC_SHOCKS = {"eps": (0.0, 0.15), "pe": (0.0, 0.20), "rate_bps": (0.0, 100.0)}
+MC_CORRELATION = [  # correlation of the eps, pe and rate_bps shocks
+    [1.0, 0.3, 0.2],
+    [0.3, 1.0, -0.3],
+    [0.2, -0.3, 1.0],
+]
+MC_RATE_PASS_THROUGH = 0.5  # share of a rate move passed to the earnings yield; P/E falls by ≈ PE × Δyield
+MC_RATE_FLOOR = 0.0  # simulated interest rates (%) are floored here
+MC_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]  # return/index level percentiles in the summary
+MC_VAR_LEVELS = [0.95, 0.99]  # confidence levels for VaR and expected shortfall
+PE_STATS_PERIODS_PER_YEAR = 252  # observations per year in the rolling P/E windows (trading days)
+PE_STATS_MIN_COVERAGE = 0.9  # share of a window's observations that must be present for its avg/std
+PE_STATS_STATE_PATH = BASE_DIR / "pe_history_tail.csv"  # per-benchmark history tail kept by build_pe_stats.py --append
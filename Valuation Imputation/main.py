@@ -1,101 +1,578 @@
-from config import DATA_DIR, OUTPUT_DIR
-from utils.aliases import rename_columns
-from utils.io import load_data
-from utils.transform import melt_pe_eps, pivot_to_matrix,generate_wide_custom_pe_sensitivity, generate_stacked_pe_sensitivity
-from utils.valuation_analysis import calculate_price_impact, create_return_matrix
-from utils.scenario_analysis import (
-    generate_pe_scenario_tables,
-    generate_eps_scenario_tables,
-    generate_combined_long_format,
-    generate_cross_basis_scenarios,
-    generate_cross_basis_scenarios_with_rates
+from config import (
+    DATA_DIR, OUTPUT_DIR, SCENARIO_CHUNK_SIZE, WORKERS, PANEL_IMPACT, RETURN_WINDOW, MANIFEST_PATH, COMPACT_OUTPUT,
+    SENSITIVITY_BASES, INPUT_CHUNK_SIZE, RUN_REPORT_PATH, PROFILE_MEMORY, PROFILE_STAGES, PROFILE_DIR, CUBE_OUTPUT,
+    MONTE_CARLO_OUTPUT, STAR_SCHEMA_OUTPUT
 )
-from utils.valuation_diagnostics import compute_pe_z_scores
-import pandas as pd
-import os
+from utils.field_mappings import FIELD_NAME_MAP
+from utils.io import (
+    load_data, iter_data, save_output, read_output, merge_output, open_output_writer, merge_output_parts, clear_output, output_path,
+    set_output_dir
+)
+from utils.incremental import (
+    fingerprint_rows, load_manifest, save_manifest, changed_rows, removed_keys, replacement_keys
+)
+from utils.executor import Stage, run_stages, shard_rows
+from utils.profiling import StageRecorder, activate, record_stage
+from utils.scenario_analysis import VALUATION_BASES, RATE_CHANGE_RANGE_BPS
+from pathlib import Path
+import time
+import argparse
 import logging
 
-# --------------------------------------------
-# 1. Setup working directory and logging
-# --------------------------------------------
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-
-logging.info(f"Working directory set to: {os.getcwd()}")
-def generate_and_save_cross_basis(df):
-    all_scenarios = []
-    for _, row in df.iterrows():
-        scenarios = generate_cross_basis_scenarios(row)
-        all_scenarios.extend(scenarios)
-    result = pd.DataFrame(all_scenarios)
-    result.to_csv(OUTPUT_DIR / "cross_basis_scenarios.csv", index=False)
-
-def generate_and_save_cross_basis_with_rates(df):
-    all_scenarios = []
-    for _, row in df.iterrows():
-        scenarios = generate_cross_basis_scenarios_with_rates(row)
-        all_scenarios.extend(scenarios)
-    result = pd.DataFrame(all_scenarios)
-    result.to_csv(OUTPUT_DIR / "cross_basis_scenarios_with_rates.csv", index=False)
-
-def main():
-    # Either hardcode this or find the first CSV file in /data
-    file_path = DATA_DIR / "sample_indices.csv"
-    if not file_path.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
+# Stage modules (transform, valuation analysis, cubes, Monte Carlo, ...) are
+# imported inside the stage functions, so a run only loads what its stages use.
+# Every stage works on the raw input columns; display names are applied only to
+# the tables being written.
+
+def _compact(df):
+    # Opt-in compact schema: slim fact table plus a per-baseline metadata side table
+    if not COMPACT_OUTPUT:
+        return df, None
+    from utils.compact import compact_scenarios
+    return compact_scenarios(df)
+
+def _save_cross_basis(df, name, part=None, rate_grid=None):
+    from utils.scenario_analysis import iter_cross_basis_scenarios
+
+    # Stream the grid in benchmark batches instead of building it in memory
+    chunks = iter_cross_basis_scenarios(df, chunk_size=SCENARIO_CHUNK_SIZE, rate_grid=rate_grid)
+    seen = set()
+    with open_output_writer(name, partition=True, part=part) as writer, \
+            open_output_writer(f"{name}_meta", part=part) as meta_writer:
+        for chunk in chunks:
+            fact, meta = _compact(chunk)
+            writer.write(fact)
+            if meta is not None:
+                meta_writer.write(_new_baselines(meta, seen))
+    return writer.rows_written
+
+def _new_baselines(meta, seen):
+    from utils.compact import new_baselines
+    return new_baselines(meta, seen)
+
+def generate_and_save_cross_basis(df, part=None):
+    return _save_cross_basis(df, "cross_basis_scenarios", part)
+
+def generate_and_save_cross_basis_with_rates(df, part=None):
+    return _save_cross_basis(df, "cross_basis_scenarios_with_rates", part, rate_grid=RATE_CHANGE_RANGE_BPS)
+
+def merge_cross_basis_shards(name, n_shards, *shard_rows):
+    merge_output_parts(name, n_shards, partition=True)
+    if COMPACT_OUTPUT:
+        from utils.compact import BASELINE_KEY
+
+        # Identical baselines in different shards were each written once per shard
+        merge_output_parts(f"{name}_meta", n_shards)
+        meta = read_output(f"{name}_meta")
+        if meta[BASELINE_KEY].duplicated().any():
+            save_output(meta.drop_duplicates(BASELINE_KEY, ignore_index=True), f"{name}_meta")
+    return sum(shard_rows)
+
+def merge_cross_basis(df, name, replace, rate_grid=None):
+    from utils.scenario_analysis import cross_basis_scenarios
+
+    # Incremental run: recompute the affected benchmarks and replace their rows
+    result = cross_basis_scenarios(df, rate_grid=rate_grid)
+    _save_or_merge(result, name, replace, partition=True)
+    return len(result)
+
+def save_cross_basis_cube(df, name, rate_grid=None):
+    from utils.cube import ScenarioCube
+
+    # Dense (benchmark, basis, eps, pe[, rate]) cube next to the long table
+    cube = ScenarioCube.build(df, rate_grid=rate_grid)
+    cube.save(output_path(name, "cube"))
+    return len(cube)
+
+def _cube_stages(df, stages=None):
+    if not CUBE_OUTPUT:
+        return []
+    cubes = [
+        ("cross-basis", Stage("cube[cross_basis_scenarios]", save_cross_basis_cube, (df, "cross_basis_scenarios"))),
+        ("cross-basis-rates", Stage("cube[cross_basis_scenarios_with_rates]", save_cross_basis_cube,
+                                    (df, "cross_basis_scenarios_with_rates"), kwargs={"rate_grid": RATE_CHANGE_RANGE_BPS})),
+    ]
+    return [stage for name, stage in cubes if stages is None or name in stages]
 
-    # Raw Data
-    df = load_data(file_path)
+def simulate_monte_carlo(df):
+    from utils.monte_carlo import monte_carlo_summary
+    return monte_carlo_summary(df)
 
-    # Raw Data with Clean Names
-    df_clean = rename_columns(df)
-    df_clean.to_csv(OUTPUT_DIR / "raw_clean_names.csv", index=False)
+def save_monte_carlo(*shards):
+    import pandas as pd
 
-    for basis in ["trailing", "fwd_1y", "fwd_2y"]:
-        prefix = f"scenario_{basis}"
-        df_impact = calculate_price_impact(df, valuation_basis=basis)
-        print(df_impact.columns)
-        print(df_impact.head())
+    # Stitch the per-shard summaries back in shard (= input row) order
+    summary = pd.concat(shards, ignore_index=True)
+    _save_or_merge(summary, "monte_carlo_summary")
+    return len(summary)
 
-        df_impact.to_csv(OUTPUT_DIR / f"{prefix}_impact.csv", index=False)
+def run_monte_carlo(df, replace=None):
+    summary = simulate_monte_carlo(df)
+    _save_or_merge(summary, "monte_carlo_summary", replace)
+    return len(summary)
 
-        return_matrix = create_return_matrix(df_impact)
-        return_matrix.to_csv(OUTPUT_DIR / f"{prefix}_return_matrix.csv")
+def _monte_carlo_stages(df, workers=1):
+    # Simulation is seeded per benchmark/date, so sharding does not change the draws
+    shards = shard_rows(df, workers)
+    if len(shards) == 1:
+        return [Stage("monte_carlo", run_monte_carlo, (df,))]
+    shard_names = [f"monte_carlo[{i}]" for i in range(len(shards))]
+    stages = [Stage(shard_name, simulate_monte_carlo, (shard,)) for shard_name, shard in zip(shard_names, shards)]
+    return stages + [Stage("monte_carlo", save_monte_carlo, deps=shard_names)]
 
-        base = df.iloc[0]
-        base_eps = base[f"eps_{basis}"]
-        base_pe = base[f"pe_{basis}"]
+def _save_or_merge(df, name, replace=None, partition=False):
+    fact, meta = _compact(df)
+    tables = [(fact, name, partition)]
+    if meta is not None:
+        tables.append((meta, f"{name}_meta", False))
+    for table, table_name, table_partition in tables:
+        if replace is None:
+            save_output(table, table_name, partition=table_partition)
+        else:
+            merge_output(table, table_name, replace[[c for c in replace.columns if c in table.columns]], partition=table_partition)
 
-        pe_pct, pe_abs = generate_pe_scenario_tables(base_pe)
-        pe_pct.to_csv(OUTPUT_DIR / f"{prefix}_pe_pct.csv", index=False)
-        pe_abs.to_csv(OUTPUT_DIR / f"{prefix}_pe_abs.csv")
+def save_clean_names(df):
+    from utils.aliases import rename_columns
+    save_output(rename_columns(df), "raw_clean_names")
 
-        eps_tbl = generate_eps_scenario_tables(base_eps)
-        eps_tbl.to_csv(OUTPUT_DIR / f"{prefix}_eps_scenarios.csv", index=False)
+def run_basis(df, basis, rows=None, replace=None):
+    """
+    Impact table and return matrix over all of `df`, plus the per-basis
+    scenario tables. Incremental runs pass the changed `rows` and their
+    `replace` keys, so the scenario tables (a grid per row) are built for
+    those rows only and merged by (Benchmark, Date). Impact is anchored to
+    the first price of the frame (or of each benchmark in panel mode), so one
+    changed row can move every other row; it is a single vectorized pass
+    over one row per input row and is rebuilt in full.
+    """
+    from utils.valuation_analysis import calculate_price_impact, create_return_matrix
 
-        combined = generate_combined_long_format(base_eps, base_pe)
-        combined.to_csv(OUTPUT_DIR / f"{prefix}_combined.csv", index=False)
+    prefix = f"scenario_{basis}"
+    df_impact = calculate_price_impact(df, valuation_basis=basis, panel=PANEL_IMPACT, window=RETURN_WINDOW)
 
-    generate_and_save_cross_basis(df)
+    save_output(df_impact, f"{prefix}_impact")
 
-    z_df = compute_pe_z_scores(df)
-    z_df = rename_columns(z_df)
-    z_df.to_csv(OUTPUT_DIR / "pe_z_scores.csv", index=False)
+    return_matrix = create_return_matrix(df_impact)
+    save_output(return_matrix, f"{prefix}_return_matrix", index=True)
+
+    save_base_tables(df if rows is None else rows, basis, replace)
+
+def base_tables(df, basis):
+    """
+    PE/EPS/combined scenario tables for every benchmark and date in `df`, keyed by Benchmark and Date.
+    """
+    from utils.scenario_analysis import pe_scenario_tables, eps_scenario_tables, combined_long_format
+
+    prefix = f"scenario_{basis}"
+    pe_pct, pe_abs = pe_scenario_tables(df, basis)
+    return {
+        f"{prefix}_pe_pct": pe_pct,
+        f"{prefix}_pe_abs": pe_abs,
+        f"{prefix}_eps_scenarios": eps_scenario_tables(df, basis),
+        f"{prefix}_combined": combined_long_format(df, basis),
+    }
+
+def save_base_tables(df, basis, replace=None):
+    for name, table in base_tables(df, basis).items():
+        if replace is None:
+            save_output(table, name)
+        else:
+            merge_output(table, name, replace)
+
+def z_scores(df):
+    from utils.aliases import rename_columns
+    from utils.valuation_diagnostics import compute_pe_z_scores
+    return rename_columns(compute_pe_z_scores(df))
+
+def run_z_scores(df, replace=None):
+    _save_or_merge(z_scores(df), "pe_z_scores", replace)
+
+def run_melt(df, replace=None):
+    from utils.transform import melt_pe_eps
 
     # PowerBI Friendly Format
-    long_df = melt_pe_eps(df_clean)
-    long_df.to_csv(OUTPUT_DIR / "long_format_eps_pe.csv", index=False)
+    long_df = melt_pe_eps(df)
+    _save_or_merge(long_df, "long_format_eps_pe", replace)
+
+def sensitivity_tables(df):
+    """
+    {artifact: table} for the wide return/price and stacked P/E sensitivity tables.
+    """
+    from utils.transform import pe_sensitivity, wide_pe_sensitivity, stack_pe_sensitivity
+
+    # One P/E grid pass feeds the wide return/price tables and the stacked table
+    sensitivity = pe_sensitivity(df, bases=SENSITIVITY_BASES)
+    sensitivity_return, sensitivity_price = wide_pe_sensitivity(sensitivity)
+    return {
+        "wide_custom_pe_sensitivity_return": sensitivity_return,
+        "wide_custom_pe_sensitivity_price": sensitivity_price,
+        "stacked_pe_sensitivity": stack_pe_sensitivity(sensitivity),
+    }
+
+def run_sensitivity(df, replace=None):
+    for name, table in sensitivity_tables(df).items():
+        _save_or_merge(table, name, replace, partition=True)
+
+def run_star_schema(df):
+    from utils.star_schema import build_star_schema
+
+    # Normalized Power BI model; keys span the whole input, so it is always rebuilt in full
+    tables = build_star_schema(df, sensitivity_bases=SENSITIVITY_BASES)
+    for name, table in tables.items():
+        save_output(table, name)
+    return sum(len(table) for table in tables.values())
+
+# Stages selectable with --stages, in run order. monte-carlo runs by default only with MONTE_CARLO_OUTPUT;
+# with STAR_SCHEMA_OUTPUT the star-schema stage replaces the denormalized tables it normalizes.
+PIPELINE_STAGES = ["clean-names", "impact", "cross-basis", "cross-basis-rates", "z-scores", "melt", "sensitivity",
+                   "monte-carlo", "star-schema"]
+STAR_SCHEMA_REPLACES = ["cross-basis", "cross-basis-rates", "z-scores", "melt", "sensitivity"]
+OPTIONAL_STAGES = {"monte-carlo": MONTE_CARLO_OUTPUT, "star-schema": STAR_SCHEMA_OUTPUT}
+DEFAULT_STAGES = [s for s in PIPELINE_STAGES
+                  if OPTIONAL_STAGES.get(s, True) and not (STAR_SCHEMA_OUTPUT and s in STAR_SCHEMA_REPLACES)]
+GRID_OUTPUTS = {"cross-basis": "cross_basis_scenarios", "cross-basis-rates": "cross_basis_scenarios_with_rates"}
+
+# Raw input columns each stage reads; None means the stage needs every column
+KEY_COLUMNS = ["date", "benchmark_id"]
+VALUATION_COLUMNS = [f"{kind}_{basis}" for basis in VALUATION_BASES for kind in ("eps", "pe")]
+PE_STAT_COLUMNS = [c for c in FIELD_NAME_MAP if "_avg_" in c or "_std_" in c]
+STAGE_COLUMNS = {
+    "clean-names": None,
+    "impact": KEY_COLUMNS + VALUATION_COLUMNS,
+    "cross-basis": KEY_COLUMNS + VALUATION_COLUMNS,
+    "cross-basis-rates": KEY_COLUMNS + VALUATION_COLUMNS + ["current_interest_rate"],
+    "z-scores": KEY_COLUMNS + VALUATION_COLUMNS + PE_STAT_COLUMNS,
+    "melt": None,
+    "sensitivity": KEY_COLUMNS + VALUATION_COLUMNS,
+    "monte-carlo": KEY_COLUMNS + VALUATION_COLUMNS + ["current_interest_rate"],
+    "star-schema": None,
+}
+
+def required_columns(stage_names):
+    """
+    Union of the input columns the given stages read, or None if any needs them all.
+    """
+    columns = []
+    for name in stage_names:
+        if STAGE_COLUMNS[name] is None:
+            return None
+        columns += [c for c in STAGE_COLUMNS[name] if c not in columns]
+    return columns
+
+def build_stages(df, workers=1, stages=DEFAULT_STAGES, bases=VALUATION_BASES):
+    """
+    Pipeline DAG for the selected `stages` (PIPELINE_STAGES names) and `bases`.
+    Every stage writes its own artifacts; the cross-basis grids are sharded by
+    benchmark across workers and stitched back in shard order.
+    """
+    dag = []
+    if "clean-names" in stages:
+        dag.append(Stage("raw_clean_names", save_clean_names, (df,)))
+    if "impact" in stages:
+        dag += [Stage(f"basis[{basis}]", run_basis, (df, basis)) for basis in bases]
 
-    # Generate Wide Custom PE Sensitivity
-    custom_pe_sensitivity_return_df, custom_pe_sensitivity_price_df = generate_wide_custom_pe_sensitivity(df_clean)
-    custom_pe_sensitivity_return_df.to_csv(OUTPUT_DIR / "wide_custom_pe_sensitivity_return.csv", index=False)
-    custom_pe_sensitivity_price_df.to_csv(OUTPUT_DIR / "wide_custom_pe_sensitivity_price.csv", index=False)
+    for stage, name, func in [
+        ("cross-basis", "cross_basis_scenarios", generate_and_save_cross_basis),
+        ("cross-basis-rates", "cross_basis_scenarios_with_rates", generate_and_save_cross_basis_with_rates),
+    ]:
+        if stage not in stages:
+            continue
+        shards = shard_rows(df, workers)
+        if len(shards) == 1:
+            dag.append(Stage(name, func, (df,)))
+            continue
+        shard_names = [f"{name}[{i}]" for i in range(len(shards))]
+        dag += [Stage(shard_name, func, (shard, i)) for i, (shard_name, shard) in enumerate(zip(shard_names, shards))]
+        dag.append(Stage(name, merge_cross_basis_shards, (name, len(shards)), deps=shard_names))
+    dag += _cube_stages(df, stages)
+    if "monte-carlo" in stages:
+        dag += _monte_carlo_stages(df, workers)
 
-    custom_pe_stacked_sensitivity_df = generate_stacked_pe_sensitivity(df_clean)
-    custom_pe_stacked_sensitivity_df.to_csv(OUTPUT_DIR / "stacked_pe_sensitivity.csv", index=False)
+    if "z-scores" in stages:
+        dag.append(Stage("z_scores", run_z_scores, (df,)))
+    if "melt" in stages:
+        dag.append(Stage("melt", run_melt, (df,)))
+    if "sensitivity" in stages:
+        dag.append(Stage("sensitivity", run_sensitivity, (df,)))
+    if "star-schema" in stages:
+        dag.append(Stage("star_schema", run_star_schema, (df,)))
+    return dag
 
-    # Generate and save cross basis with rates
-    generate_and_save_cross_basis_with_rates(df)
+def build_incremental_stages(df, changed, stages=DEFAULT_STAGES, removed=None):
+    """
+    Stages for an incremental run. Whole-frame stages (clean names, per-basis
+    impact, dense cubes, the star schema) are cheap and rerun in full. Row-level
+    outputs, including the per-basis scenario tables, are recomputed for the
+    `changed` rows only and merged by (Benchmark, Date). Per-benchmark grids
+    carry no date, so they are recomputed from every row of the affected
+    benchmarks and merged by Benchmark. `removed` (benchmark_id, date) keys,
+    rows deleted from the input, are replaced by nothing, so their rows are
+    dropped and their benchmarks' grids recomputed.
+    """
+    import pandas as pd
+
+    removed = removed if removed is not None else pd.DataFrame(columns=["benchmark_id", "date"])
+    df_changed = df.loc[changed.to_numpy()]
+    affected = pd.concat([df_changed["benchmark_id"], removed["benchmark_id"]]).astype(str).unique()
+    df_affected = df[df["benchmark_id"].astype(str).isin(affected)]
+    row_keys = pd.concat([replacement_keys(df_changed), replacement_keys(removed)], ignore_index=True).drop_duplicates(ignore_index=True)
+    benchmark_keys = pd.DataFrame({"Benchmark": affected})
+
+    dag = [Stage("raw_clean_names", save_clean_names, (df,))]
+    dag += [Stage(f"basis[{basis}]", run_basis, (df, basis), kwargs={"rows": df_changed, "replace": row_keys})
+            for basis in VALUATION_BASES]
+    optional = [
+        ("cross-basis", Stage("cross_basis_scenarios", merge_cross_basis,
+                              (df_affected, "cross_basis_scenarios", benchmark_keys))),
+        ("cross-basis-rates", Stage("cross_basis_scenarios_with_rates", merge_cross_basis,
+                                    (df_affected, "cross_basis_scenarios_with_rates", benchmark_keys),
+                                    kwargs={"rate_grid": RATE_CHANGE_RANGE_BPS})),
+        ("z-scores", Stage("z_scores", run_z_scores, (df_changed,), kwargs={"replace": row_keys})),
+        ("melt", Stage("melt", run_melt, (df_changed,), kwargs={"replace": row_keys})),
+        ("sensitivity", Stage("sensitivity", run_sensitivity, (df_affected,), kwargs={"replace": benchmark_keys})),
+        ("monte-carlo", Stage("monte_carlo", run_monte_carlo, (df_changed,), kwargs={"replace": row_keys})),
+        ("star-schema", Stage("star_schema", run_star_schema, (df,))),
+    ]
+    dag += _cube_stages(df, stages)
+    dag += [stage for name, stage in optional if name in stages]
+    return dag
+
+class _ChunkOutputs:
+    """
+    Appending writers for a chunked run, opened lazily per artifact
+    (plus its *_meta side table in compact mode).
+    """
+
+    def __init__(self):
+        self.writers = {}
+        self.baselines = {}
+
+    def write(self, df, name, partition=False, compact=True):
+        # compact=False for the tables a full run writes as they are (clean names, impact, base tables)
+        fact, meta = _compact(df) if compact else (df, None)
+        if meta is not None:
+            meta = _new_baselines(meta, self.baselines.setdefault(name, set()))
+        for table, table_name, table_partition in [(fact, name, partition), (meta, f"{name}_meta", False)]:
+            if table is None:
+                continue
+            if table_name not in self.writers:
+                self.writers[table_name] = open_output_writer(table_name, partition=table_partition)
+            with record_stage(f"write[{table_name}]", rows_in=len(table)) as record:
+                self.writers[table_name].write(table)
+                record["rows_out"] = len(table)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+def _recorded_chunks(chunks):
+    # Record the time spent reading each input chunk as a "load" stage
+    chunks = iter(chunks)
+    while True:
+        with record_stage("load") as record:
+            chunk = next(chunks, None)
+            record["rows_out"] = len(chunk) if chunk is not None else 0
+        if chunk is None:
+            return
+        yield chunk
+
+def run_chunked(file_path, chunk_size=INPUT_CHUNK_SIZE, stages=DEFAULT_STAGES, bases=VALUATION_BASES):
+    """
+    Streaming pipeline for inputs larger than memory. Each input chunk goes
+    through clean names → impact → scenarios → z-scores → long format → sensitivity
+    (the selected `stages`), and every output is appended chunk by chunk, so
+    peak memory is bounded by the chunk size. Only the return matrices need a
+    whole-history view; they are pivoted at the end from a three-column
+    extract. Row-level outputs match a full run, except the long format, which
+    is ordered chunk by chunk.
+    """
+    import pandas as pd
+    from utils.scenario_analysis import iter_cross_basis_scenarios
+    from utils.valuation_analysis import calculate_price_impact, create_return_matrix
+
+    if PANEL_IMPACT and "impact" in stages:
+        raise ValueError("Chunked ingestion does not support PANEL_IMPACT; groups would span chunks")
+    if "star-schema" in stages:
+        raise ValueError("Chunked ingestion does not support the star schema; its keys span the whole input")
+    if CUBE_OUTPUT:
+        logging.warning("CUBE_OUTPUT is not supported in chunked runs; the cubes are not written")
+
+    outputs = _ChunkOutputs()
+    base_prices = {}
+    returns = {basis: [] for basis in bases}
+    n_rows = 0
+    grids = [(stage, name, RATE_CHANGE_RANGE_BPS if stage == "cross-basis-rates" else None)
+             for stage, name in GRID_OUTPUTS.items() if stage in stages]
+
+    for _, name, _ in grids:
+        clear_output(name)
+        clear_output(f"{name}_meta")
+
+    try:
+        for chunk in _recorded_chunks(iter_data(file_path, chunk_size, columns=required_columns(stages))):
+            n_rows += len(chunk)
+            logging.info(f"Processing input chunk: {n_rows:,} rows so far")
+
+            # Stages are recorded under the same names as in a full run, once per chunk
+            if "clean-names" in stages:
+                from utils.aliases import rename_columns
+                with record_stage("raw_clean_names", rows_in=len(chunk)):
+                    outputs.write(rename_columns(chunk), "raw_clean_names", compact=False)
+
+            for basis in bases if "impact" in stages else []:
+                with record_stage(f"basis[{basis}]", rows_in=len(chunk)):
+                    # Anchor every chunk to the first available price of the whole input
+                    impact = calculate_price_impact(chunk, valuation_basis=basis, base_price=base_prices.get(basis))
+                    if basis not in base_prices and impact["Implied_Price"].notna().any():
+                        base_prices[basis] = impact["Base_Price"].iloc[0]
+                    outputs.write(impact, f"scenario_{basis}_impact", compact=False)
+                    returns[basis].append(impact[["benchmark_id", "date", "Implied_Return"]])
+                    for name, table in base_tables(chunk, basis).items():
+                        outputs.write(table, name, compact=False)
+
+            for _, name, rate_grid in grids:
+                with record_stage(name, rows_in=len(chunk)):
+                    for scenarios in iter_cross_basis_scenarios(chunk, chunk_size=SCENARIO_CHUNK_SIZE, rate_grid=rate_grid):
+                        outputs.write(scenarios, name, partition=True)
+
+            if "z-scores" in stages:
+                with record_stage("z_scores", rows_in=len(chunk)):
+                    outputs.write(z_scores(chunk), "pe_z_scores")
+            if "monte-carlo" in stages:
+                with record_stage("monte_carlo", rows_in=len(chunk)):
+                    outputs.write(simulate_monte_carlo(chunk), "monte_carlo_summary")
+            if "melt" in stages:
+                from utils.transform import melt_pe_eps
+                with record_stage("melt", rows_in=len(chunk)):
+                    outputs.write(melt_pe_eps(chunk), "long_format_eps_pe")
+
+            if "sensitivity" in stages:
+                with record_stage("sensitivity", rows_in=len(chunk)):
+                    for name, table in sensitivity_tables(chunk).items():
+                        outputs.write(table, name, partition=True)
+    finally:
+        outputs.close()
+
+    if not n_rows:
+        raise ValueError(f"No rows found in {file_path}")
+
+    for basis in bases if "impact" in stages else []:
+        with record_stage(f"basis[{basis}]", rows_in=n_rows):
+            return_matrix = create_return_matrix(pd.concat(returns[basis], ignore_index=True))
+            save_output(return_matrix, f"scenario_{basis}_return_matrix", index=True)
+
+def run_pipeline(file_path, workers=WORKERS, incremental=False, chunked=False, recorder=None,
+                 stages=DEFAULT_STAGES, bases=VALUATION_BASES, manifest_path=MANIFEST_PATH):
+    """
+    Run the selected `stages` for the valuation `bases` on `file_path`. The
+    input is read projected onto the columns those stages need. Only a run of
+    every default stage updates the incremental manifest, and --incremental
+    always runs every stage, since the manifest covers all outputs.
+    """
+    complete = set(stages) >= set(DEFAULT_STAGES) and set(bases) == set(VALUATION_BASES)
+    if chunked:
+        if incremental:
+            raise ValueError("--chunked and --incremental cannot be combined")
+        run_chunked(file_path, stages=stages, bases=bases)
+        return
+    if incremental and not complete:
+        raise ValueError("--incremental runs every stage; it cannot be combined with --stages or --bases")
+
+    # Raw Data, projected onto the columns the pipeline stages read
+    with record_stage("load") as record:
+        df = load_data(file_path, columns=required_columns(stages))
+        record["rows_out"] = len(df)
+
+    # Sharded grids append into shared outputs, so a fresh run clears the previous ones first
+    grid_outputs = [name for stage, name in GRID_OUTPUTS.items() if stage in stages]
+    if not complete:
+        # Partial run: leave the manifest to the next full run
+        for name in grid_outputs:
+            clear_output(name)
+        run_stages(build_stages(df, workers, stages, bases), workers, recorder)
+        return
+
+    with record_stage("fingerprint", rows_in=len(df)):
+        fingerprint = fingerprint_rows(df)
+        manifest = load_manifest(manifest_path) if incremental else None
+
+    if manifest is None:
+        if incremental:
+            logging.info("No manifest found; running the full pipeline")
+        for name in grid_outputs:
+            clear_output(name)
+
+        run_stages(build_stages(df, workers, stages, bases), workers, recorder)
+    else:
+        changed = changed_rows(fingerprint, manifest)
+        removed = removed_keys(fingerprint, manifest)
+        logging.info(f"Incremental run: {int(changed.sum())} new or changed rows out of {len(df)}, "
+                     f"{len(removed)} removed")
+        if not changed.any() and removed.empty:
+            return
+        run_stages(build_incremental_stages(df, changed, stages, removed), workers, recorder)
+
+    save_manifest(fingerprint, manifest_path)
+
+def main(workers=WORKERS, incremental=False, chunked=False, report_path=RUN_REPORT_PATH,
+         trace_memory=PROFILE_MEMORY, profile=PROFILE_STAGES, input_path=None, output_dir=None,
+         stages=DEFAULT_STAGES, bases=VALUATION_BASES):
+    """
+    Run the pipeline and write a per-stage run report (wall/CPU time, rows
+    in/out, memory) to `report_path`, even when a stage fails. Stages named in
+    `profile` also run under cProfile, with stats in PROFILE_DIR. Reads
+    `input_path` (data/sample_indices.csv by default) and writes to
+    `output_dir` (OUTPUT_DIR by default; a custom directory also holds its
+    own incremental manifest).
+    """
+    file_path = Path(input_path) if input_path else DATA_DIR / "sample_indices.csv"
+    if not file_path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+    unknown = [s for s in stages if s not in PIPELINE_STAGES] + [b for b in bases if b not in VALUATION_BASES]
+    if unknown:
+        raise ValueError(f"Unknown stages or bases: {unknown}")
+
+    set_output_dir(output_dir or OUTPUT_DIR)
+    manifest_path = Path(output_dir) / MANIFEST_PATH.name if output_dir else MANIFEST_PATH
+
+    recorder = StageRecorder(trace_memory=trace_memory, profile=profile, profile_dir=PROFILE_DIR)
+    started = time.perf_counter()
+    try:
+        with activate(recorder):
+            run_pipeline(file_path, workers, incremental, chunked, recorder, stages, bases, manifest_path)
+    finally:
+        if report_path:
+            recorder.save(
+                report_path, input=str(file_path), workers=workers, incremental=incremental, chunked=chunked,
+                trace_memory=trace_memory, stages=list(stages), wall_s=time.perf_counter() - started
+            )
+            logging.info(f"Run report written to {report_path}")
+        if recorder.records:
+            import pandas as pd
+            with pd.option_context("display.width", 200, "display.max_columns", None):
+                logging.info(f"Stage summary:\n{recorder.summary().to_string()}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run the valuation imputation pipeline.")
+    parser.add_argument("--input", help="Input file (default: data/sample_indices.csv)")
+    parser.add_argument("--output-dir", help=f"Directory for the outputs (default: {OUTPUT_DIR})")
+    parser.add_argument("--stages", nargs="+", default=DEFAULT_STAGES, choices=PIPELINE_STAGES, metavar="STAGE",
+                        help=f"Stages to run (default: all of {', '.join(DEFAULT_STAGES)}); one of {', '.join(PIPELINE_STAGES)}")
+    parser.add_argument("--bases", nargs="+", default=VALUATION_BASES, choices=VALUATION_BASES,
+                        help="Valuation bases for the impact stage")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Worker processes (1 = serial run)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only recompute rows that are new or changed since the last run's manifest")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Stream the input in INPUT_CHUNK_SIZE-row chunks for files larger than memory")
+    parser.add_argument("--report", default=RUN_REPORT_PATH,
+                        help="Where to write the per-stage run report (.json or .csv; empty string to skip)")
+    parser.add_argument("--profile-memory", action="store_true", default=PROFILE_MEMORY,
+                        help="Trace peak memory per stage with tracemalloc (slower)")
+    parser.add_argument("--profile", nargs="*", default=PROFILE_STAGES, metavar="STAGE",
+                        help="Stages to run under cProfile, e.g. --profile sensitivity basis")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    main(args.workers, args.incremental, args.chunked, args.report, args.profile_memory, args.profile,
+         args.input, args.output_dir, args.stages, args.bases)
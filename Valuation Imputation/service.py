@@ -0,0 +1,272 @@
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR
+from utils.io import load_data
+from utils.cache import SCENARIO_CACHE
+from utils.scenario_analysis import (
+    generate_combined_long_format,
+    cross_basis_scenarios,
+    VALUATION_BASES,
+    CROSS_BASIS_EPS_RANGE,
+    CROSS_BASIS_PE_RANGE,
+    RATE_CHANGE_RANGE_BPS
+)
+from utils.valuation_diagnostics import compute_pe_z_scores
+
+DEFAULT_INPUT = DATA_DIR / "sample_indices.csv"
+
+
+class RequestError(ValueError):
+    """
+    A bad request parameter; reported to the client with `status`.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _grid(params, name, default=None, dtype=float):
+    # Comma-separated grid values, e.g. eps_changes=-0.2,-0.1,0,0.1,0.2
+    if name not in params:
+        return default
+    try:
+        return np.array([dtype(v) for v in params[name].split(",") if v.strip()])
+    except ValueError:
+        raise RequestError(f"{name} must be a comma-separated list of numbers")
+
+
+def _date(params):
+    try:
+        return pd.Timestamp(params["date"])
+    except ValueError:
+        raise RequestError(f"Invalid date: {params['date']}")
+
+
+def _list(params, name, default, allowed):
+    values = params[name].split(",") if name in params else list(default)
+    unknown = [v for v in values if v not in allowed]
+    if unknown:
+        raise RequestError(f"Unknown {name}: {unknown}; expected some of {list(allowed)}")
+    return values
+
+
+class ScenarioService:
+    """
+    Warm state for the scenario endpoints: the input is loaded once, base
+    EPS/PE/rates stay in memory and the z-scores are computed up front, so a
+    request only evaluates the grid it asks for. `reload()` swaps in a fresh
+    snapshot atomically; requests in flight keep the one they started with.
+    """
+
+    # Query parameters each endpoint accepts (besides format=csv); anything else is rejected
+    PARAMS = {
+        "health": (),
+        "benchmarks": (),
+        "combined": ("benchmark", "date", "bases", "eps_changes", "pe_changes"),
+        "cross_basis": ("benchmark", "date", "bases", "eps_grid", "pe_grid", "rate_grid"),
+        "z_scores": ("benchmark", "date", "pe_type", "horizon"),
+        "reload": (),
+    }
+
+    def __init__(self, file_path=DEFAULT_INPUT):
+        self.file_path = Path(file_path)
+        self.reload()
+
+    def reload(self, params=None) -> dict:
+        started = time.perf_counter()
+        df = load_data(self.file_path)
+        df = df.sort_values(["benchmark_id", "date"], kind="stable", ignore_index=True)
+        snapshot = {
+            "df": df,
+            "z_scores": compute_pe_z_scores(df),
+            "loaded_at": pd.Timestamp.now(tz="UTC").isoformat(timespec="seconds"),
+        }
+        self._snapshot = snapshot  # single reference swap, no lock needed for readers
+        logging.info(f"Loaded {len(df):,} rows from {self.file_path} in {time.perf_counter() - started:.3f}s")
+        return self.health({})
+
+    def _rows(self, params, latest=True):
+        """
+        Input rows for the requested benchmark (and date). Without a date only
+        the benchmark's latest row is used, as the base for single-row generators.
+        """
+        df = self._snapshot["df"]
+        if "benchmark" in params:
+            df = df[df["benchmark_id"] == params["benchmark"]]
+            if df.empty:
+                raise RequestError(f"Unknown benchmark: {params['benchmark']}", status=404)
+        if "date" in params:
+            df = df[df["date"] == _date(params)]
+            if df.empty:
+                raise RequestError(f"No rows for date {params['date']}", status=404)
+        elif latest:
+            df = df.groupby("benchmark_id", sort=False).tail(1)
+        return df
+
+    def health(self, params) -> dict:
+        snapshot = self._snapshot
+        return {
+            "input": str(self.file_path),
+            "rows": len(snapshot["df"]),
+            "benchmarks": int(snapshot["df"]["benchmark_id"].nunique()),
+            "loaded_at": snapshot["loaded_at"],
+            "cache": SCENARIO_CACHE.stats(),
+        }
+
+    def benchmarks(self, params) -> pd.DataFrame:
+        df = self._snapshot["df"]
+        return df.groupby("benchmark_id", sort=False)["date"].agg(["min", "max", "size"]).reset_index().rename(
+            columns={"benchmark_id": "Benchmark", "min": "First Date", "max": "Last Date", "size": "Rows"}
+        )
+
+    def combined(self, params) -> pd.DataFrame:
+        """
+        generate_combined_long_format for one benchmark and a single basis in
+        `bases`; optional eps_changes/pe_changes grids as fractions (0.1 = +10%).
+        """
+        if "benchmark" not in params:
+            raise RequestError("benchmark is required")
+        basis = _list(params, "bases", ["trailing"], VALUATION_BASES)
+        if len(basis) != 1:
+            raise RequestError("combined takes a single basis")
+        row = self._rows(params).iloc[-1]
+        grids = {}
+        for key in ("eps_changes", "pe_changes"):
+            grid = _grid(params, key)
+            if grid is not None:
+                grids[key] = grid
+        return generate_combined_long_format(row[f"eps_{basis[0]}"], row[f"pe_{basis[0]}"], **grids)
+
+    def cross_basis(self, params) -> pd.DataFrame:
+        """
+        EPS × PE × Interest Rate scenarios (cross_basis_scenarios with a rate
+        grid) for the benchmark's latest row, or every benchmark without one.
+        Optional bases, eps_grid/pe_grid (fractions) and rate_grid (bps);
+        rate_grid= (empty) drops the rate dimension.
+        """
+        rate_grid = _grid(params, "rate_grid", RATE_CHANGE_RANGE_BPS)
+        return cross_basis_scenarios(
+            self._rows(params),
+            bases=_list(params, "bases", VALUATION_BASES, VALUATION_BASES),
+            eps_grid=_grid(params, "eps_grid", CROSS_BASIS_EPS_RANGE),
+            pe_grid=_grid(params, "pe_grid", CROSS_BASIS_PE_RANGE),
+            rate_grid=rate_grid if len(rate_grid) else None
+        )
+
+    def z_scores(self, params) -> pd.DataFrame:
+        """
+        Precomputed P/E z-scores, filtered by benchmark, date, pe_type and horizon.
+        """
+        snapshot = self._snapshot
+        z = snapshot["z_scores"]
+        if "benchmark" in params:
+            if not (snapshot["df"]["benchmark_id"] == params["benchmark"]).any():
+                raise RequestError(f"Unknown benchmark: {params['benchmark']}", status=404)
+            z = z[z["Benchmark"] == params["benchmark"]]
+        if "date" in params:
+            z = z[z["Date"] == _date(params)]
+        for key, column in [("pe_type", "PE_Type"), ("horizon", "Horizon")]:
+            if key in params:
+                z = z[z[column].isin(params[key].split(","))]
+        return z
+
+
+class ScenarioRequestHandler(BaseHTTPRequestHandler):
+    service = None  # set by make_server
+
+    GET_ROUTES = {
+        "/health": "health",
+        "/benchmarks": "benchmarks",
+        "/combined": "combined",
+        "/cross_basis": "cross_basis",
+        "/z_scores": "z_scores",
+    }
+    POST_ROUTES = {
+        "/reload": "reload",
+    }
+
+    def _send(self, status, body: bytes, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, routes):
+        url = urlparse(self.path)
+        name = routes.get(url.path)
+        if name is None:
+            return self._send(404, json.dumps({"error": f"Unknown endpoint: {url.path}"}).encode())
+
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        unknown = sorted(set(params) - set(self.service.PARAMS.get(name, ())) - {"format"})
+        if unknown:
+            return self._send(400, json.dumps({"error": f"Unknown parameters for {url.path}: {unknown}"}).encode())
+        started = time.perf_counter()
+        try:
+            result = getattr(self.service, name)(params)
+        except RequestError as e:
+            return self._send(e.status, json.dumps({"error": str(e)}).encode())
+        except KeyError as e:
+            return self._send(400, json.dumps({"error": str(e)}).encode())
+        except Exception as e:
+            logging.exception(f"Request failed: {self.path}")
+            return self._send(500, json.dumps({"error": str(e)}).encode())
+
+        if isinstance(result, pd.DataFrame):
+            if params.get("format") == "csv":
+                body = result.to_csv(index=False).encode()
+                content_type = "text/csv"
+            else:
+                body = result.to_json(orient="records", date_format="iso").encode()
+                content_type = "application/json"
+        else:
+            body = json.dumps(result).encode()
+            content_type = "application/json"
+        self._send(200, body, content_type)
+        logging.debug(f"{self.path} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def do_GET(self):
+        self._dispatch(self.GET_ROUTES)
+
+    def do_POST(self):
+        self._dispatch(self.POST_ROUTES)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+def make_server(service: ScenarioService, host="127.0.0.1", port=8050) -> ThreadingHTTPServer:
+    """
+    Threaded HTTP server for `service`: one thread per request, all sharing the warm state.
+    """
+    handler = type("BoundScenarioRequestHandler", (ScenarioRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve scenario what-ifs from warm in-memory state.")
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="Input file to load (reload with POST /reload)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = make_server(ScenarioService(args.input), args.host, args.port)
+    logging.info(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
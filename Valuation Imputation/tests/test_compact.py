@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+import main
+from benchmark_scenarios import build_synthetic_universe
+from utils import io
+from utils.compact import compact_scenarios, expand_scenarios
+from utils.scenario_analysis import cross_basis_scenarios, RATE_CHANGE_RANGE_BPS
+from utils.transform import pe_sensitivity, stack_pe_sensitivity
+
+
+def _chunks():
+    # Two chunks whose values differ enough to pick different dtypes if the values decided them:
+    # P/E scenarios beyond int8 and EPS values beyond float32 precision in the second one only
+    df = build_synthetic_universe(n_benchmarks=6)
+    df.loc[3:, "pe_trailing"] *= 6
+    df.loc[3:, "eps_trailing"] += 1e-9
+    return [df.iloc[:3], df.iloc[3:]]
+
+
+@pytest.mark.parametrize("table", [
+    lambda df: stack_pe_sensitivity(pe_sensitivity(df)),
+    lambda df: cross_basis_scenarios(df, rate_grid=RATE_CHANGE_RANGE_BPS),
+])
+def test_every_chunk_of_an_artifact_gets_the_same_schema(table):
+    facts, metas = zip(*(compact_scenarios(table(chunk)) for chunk in _chunks()))
+    schema = lambda df: {c: str(t) for c, t in df.dtypes.items()}
+    assert schema(facts[0]) == schema(facts[1])
+    assert schema(metas[0]) == schema(metas[1])
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_compact_chunks_stream_into_one_file(tmp_path, fmt):
+    pytest.importorskip("pyarrow")
+    facts = [compact_scenarios(stack_pe_sensitivity(pe_sensitivity(chunk)))[0] for chunk in _chunks()]
+    target = tmp_path / f"stacked.{fmt}"
+    writer = io.ChunkWriter(target, fmt=fmt)
+    for fact in facts:
+        writer.write(fact)
+    writer.close()
+
+    written = pd.read_parquet(target) if fmt == "parquet" else pd.read_feather(target)
+    assert len(written) == sum(len(fact) for fact in facts)
+    assert written["PE Scenario"].tolist() == pd.concat(facts)["PE Scenario"].tolist()
+
+
+def _read_all(directory):
+    tables = {}
+    for path in sorted(directory.glob("*.csv")):
+        if path.stem.endswith("_meta") or "return_matrix" in path.stem:
+            continue
+        df = pd.read_csv(path, float_precision="round_trip")
+        meta = path.with_name(f"{path.stem}_meta.csv")
+        if meta.exists():
+            df = expand_scenarios(df, pd.read_csv(meta, float_precision="round_trip"))
+        tables[path.stem] = df.sort_values(sorted(df.columns), ignore_index=True)[sorted(df.columns)]
+    return tables
+
+
+def test_compact_incremental_run_matches_compact_full_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "COMPACT_OUTPUT", True)
+    monkeypatch.setattr(io, "OUTPUT_DIR", io.OUTPUT_DIR)
+    monkeypatch.setenv(io.OUTPUT_DIR_ENV, str(io.OUTPUT_DIR))
+
+    before = build_synthetic_universe(n_benchmarks=4, n_dates=3, horizons=(1, 5))
+    after = before.drop(index=[1])                              # deleted row
+    after.loc[after.index[0], "eps_trailing"] *= 1.05           # edited row
+    appended = after[after["date"] == after["date"].max()].assign(date="2025-08-06")
+    after = pd.concat([after, appended], ignore_index=True)     # new date
+    before.to_csv(tmp_path / "before.csv", index=False)
+    after.to_csv(tmp_path / "after.csv", index=False)
+
+    def run(input_name, output, incremental):
+        io.set_output_dir(tmp_path / output)
+        main.run_pipeline(tmp_path / input_name, workers=1, incremental=incremental,
+                          manifest_path=tmp_path / f"{output}_manifest.csv")
+
+    run("before.csv", "incremental", incremental=False)
+    run("after.csv", "incremental", incremental=True)
+    run("after.csv", "full", incremental=False)
+
+    full, incremental = _read_all(tmp_path / "full"), _read_all(tmp_path / "incremental")
+    assert sorted(full) == sorted(incremental)
+    for name in full:
+        pd.testing.assert_frame_equal(incremental[name], full[name], check_exact=True, obj=name)
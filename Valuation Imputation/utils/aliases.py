@@ -1,20 +1,63 @@
 # utils/aliases.py
 
+import os
+import logging
+from types import MappingProxyType
 import pandas as pd
 from config import USE_EXTERNAL_MAPPING, MAPPING_PATH
 
+# (mapping file mtime, mapping) of the last load; swapped as one reference, so readers need no lock
+_MAPPING_CACHE = (object(), None)
 
-def get_field_mapping():
+
+def _mapping_version():
+    # mtime of the external mapping file; None when it is not used or cannot be read
+    if not USE_EXTERNAL_MAPPING:
+        return None
+    try:
+        return os.stat(MAPPING_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_field_mapping():
     if USE_EXTERNAL_MAPPING:
         try:
             df = pd.read_csv(MAPPING_PATH)
             return dict(zip(df["original"], df["new_name"]))
         except Exception as e:
-            print(f"⚠️ Failed to load external mapping. Falling back to default. Error: {e}")
+            logging.warning(f"Failed to load external mapping. Falling back to default. Error: {e}")
 
     from utils.field_mappings import FIELD_NAME_MAP
     return FIELD_NAME_MAP
 
 
+def get_field_mapping():
+    """
+    Raw → display column names, as a read-only mapping. Loaded once and
+    cached; with USE_EXTERNAL_MAPPING the file is re-read only when its mtime
+    changes, so transforms can call this freely.
+    """
+    global _MAPPING_CACHE
+    version = _mapping_version()
+    cached_version, mapping = _MAPPING_CACHE
+    if mapping is None or cached_version != version:
+        mapping = MappingProxyType(dict(_load_field_mapping()))
+        _MAPPING_CACHE = (version, mapping)
+    return mapping
+
+
+def display_columns(columns) -> list:
+    mapping = get_field_mapping()
+    return [mapping.get(c, c) for c in columns]
+
+
 def rename_columns(df):
-    return df.rename(columns=get_field_mapping())
+    """
+    `df` under its display column names. Only the labels change: the result
+    shares its data with `df`, so the pipeline keeps raw names internally and
+    applies this just before writing.
+    """
+    renamed = df.copy(deep=False)
+    renamed.columns = display_columns(df.columns)
+    return renamed
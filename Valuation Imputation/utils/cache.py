@@ -0,0 +1,171 @@
+# utils/cache.py
+
+import hashlib
+import logging
+import numbers
+import pickle
+import threading
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import SCENARIO_CACHE_SIZE, SCENARIO_CACHE_DIR
+from utils.grids import GridSpec
+
+# Bump when a cached generator's output changes so stale on-disk entries are ignored
+CACHE_VERSION = 2
+
+
+def _normalize(value):
+    """
+    Canonical, hashable description of a generator argument. Arrays (and
+    pandas Series/Index or GridSpecs, via their values) hash by
+    dtype/shape/bytes and all real numbers by their exact float value, so
+    np.float64(27.8) and 27.8 share a cache entry. Other types raise
+    TypeError rather than being keyed by a possibly truncated repr.
+    """
+    if isinstance(value, (pd.Series, pd.Index)):
+        value = value.to_numpy()
+    elif isinstance(value, GridSpec):
+        value = np.asarray(value)
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return ("object_array", value.shape, tuple(_normalize(v) for v in value.ravel()))
+        return ("ndarray", value.dtype.str, value.shape, hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, (bool, np.bool_)):
+        return ("bool", bool(value))
+    if isinstance(value, numbers.Real):
+        return ("real", float(value).hex())
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_normalize(v) for v in value))
+    if value is None or isinstance(value, str):
+        return (type(value).__name__, value)
+    raise TypeError(f"Cannot build a scenario cache key from {type(value).__name__} arguments")
+
+
+def cache_key(name: str, args: tuple, kwargs: dict) -> str:
+    payload = (CACHE_VERSION, name, _normalize(args), tuple(sorted((k, _normalize(v)) for k, v in kwargs.items())))
+    return hashlib.sha256(repr(payload).encode()).hexdigest()
+
+
+def _copy_result(result):
+    # Cached frames are shared, so hand out copies the caller may mutate freely
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy()
+    if isinstance(result, tuple):
+        return tuple(_copy_result(r) for r in result)
+    return result
+
+
+class ScenarioCache:
+    """
+    Bounded in-memory LRU of generator results with an optional on-disk pickle
+    store (`cache_dir`) shared across processes and sessions. Tracks hit/miss
+    counts for stats(). The in-memory LRU is guarded by a lock, so threads
+    (e.g. the scenario service's request handlers) can share one cache.
+    """
+
+    def __init__(self, maxsize: int = 256, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key):
+        """
+        Return (found, value), checking memory first and then the disk store.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+
+        if self.cache_dir is not None:
+            path = self._disk_path(key)
+            if path.exists():
+                try:
+                    with open(path, "rb") as f:
+                        value = pickle.load(f)
+                except Exception as e:
+                    logging.warning(f"Ignoring unreadable cache entry {path}: {e}")
+                else:
+                    with self._lock:
+                        self.disk_hits += 1
+                    self._remember(key, value)
+                    return True, value
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._disk_path(key).with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp.replace(self._disk_path(key))  # atomic, so concurrent readers never see a partial file
+
+    def _remember(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if disk and self.cache_dir is not None and self.cache_dir.exists():
+            for path in self.cache_dir.glob("*.pkl"):
+                path.unlink()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+SCENARIO_CACHE = ScenarioCache(SCENARIO_CACHE_SIZE, SCENARIO_CACHE_DIR)
+
+
+def cached_scenario(func):
+    """
+    Memoize a pure scenario generator on SCENARIO_CACHE, keyed by a hash of its
+    name and all inputs (base values and grids). Pass `use_cache=False` to bypass.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, use_cache=True, **kwargs):
+        if not use_cache:
+            return func(*args, **kwargs)
+
+        key = cache_key(name, args, kwargs)
+        found, result = SCENARIO_CACHE.get(key)
+        if not found:
+            result = func(*args, **kwargs)
+            SCENARIO_CACHE.put(key, _copy_result(result))
+        return _copy_result(result)
+
+    return wrapper
@@ -0,0 +1,133 @@
+# utils/compact.py
+
+import numpy as np
+import pandas as pd
+
+from config import CATEGORICAL_COLUMNS
+
+# Scenario deltas that only take a handful of grid values
+STEP_COLUMNS = ["EPS Change (%)", "PE Change (%)", "Interest Rate Change (bps)", "PE Scenario"]
+# Baseline values that repeat on every scenario row of a benchmark/basis
+METADATA_COLUMNS = ["Current EPS", "Current PE", "Current Index Level", "Current Interest Rate"]
+METADATA_KEYS = ["Benchmark", "Date", "EPS Type"]
+# Join key between the fact and side tables: a hash of the keys and baseline values
+BASELINE_KEY = "Baseline Key"
+
+
+# Every grid in GRID_SPECS steps through integers well inside ±32767
+STEP_DTYPE = np.int16
+
+
+def _compact_column(col: pd.Series) -> pd.Series:
+    # The dtype follows from the column name and input dtype only, so every chunk agrees
+    if col.name in CATEGORICAL_COLUMNS:
+        return col.astype("category")
+
+    if col.name in STEP_COLUMNS and pd.api.types.is_numeric_dtype(col):
+        # Grid steps are integers up to float drift (e.g. 30.000000000000004 → 30)
+        values = pd.to_numeric(col).to_numpy(dtype=float)
+        steps = np.rint(values)
+        info = np.iinfo(STEP_DTYPE)
+        if not np.allclose(values, steps, rtol=0, atol=1e-6) or (len(steps) and (steps.min() < info.min or steps.max() > info.max)):
+            raise ValueError(f"{col.name} holds values that are not {np.dtype(STEP_DTYPE).name} grid steps")
+        return pd.Series(steps.astype(STEP_DTYPE), index=col.index, name=col.name)
+
+    if pd.api.types.is_float_dtype(col):
+        return col.astype(np.float32)
+
+    return col
+
+
+def baseline_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    Stable int64 key per row from its METADATA_KEYS and METADATA_COLUMNS
+    values. It depends only on the values, so every chunk, shard and run
+    gives a baseline the same key.
+    """
+    cols = [c for c in METADATA_KEYS + METADATA_COLUMNS if c in df.columns]
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy().view(np.int64)
+
+
+def compact_scenarios(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+    """
+    Opt-in compact schema for scenario tables. Returns (fact, metadata):
+
+    - label columns (CATEGORICAL_COLUMNS) become categoricals,
+    - scenario step columns (STEP_COLUMNS) become int16 (ValueError if a
+      value is not an integer step in range),
+    - every other float column becomes float32 (about 7 significant digits),
+    - Current EPS/PE/Index/Rate move to a side table with one row per
+      baseline, joined back on BASELINE_KEY (see baseline_keys).
+
+    Both the split and the dtypes depend only on the column names and input
+    dtypes, never on the values, so every chunk of an artifact gets the same
+    schema. `metadata` is None when the table has no metadata columns.
+    Chunked writers should drop side-table rows already written with
+    new_baselines.
+    """
+    keys = [k for k in METADATA_KEYS if k in df.columns]
+    meta_cols = [c for c in METADATA_COLUMNS if c in df.columns]
+
+    meta = None
+    if keys and meta_cols:
+        key = baseline_keys(df)
+        first = ~pd.Series(key).duplicated().to_numpy()
+        meta = pd.DataFrame({BASELINE_KEY: key[first], **{c: df[c].to_numpy()[first] for c in keys + meta_cols}})
+        df = pd.DataFrame({BASELINE_KEY: key, **{c: df[c] for c in df.columns if c not in meta_cols}}, index=df.index)
+
+    fact = pd.DataFrame({c: _compact_column(df[c]) for c in df.columns})
+    if meta is not None:
+        # The side table is tiny, so baseline values keep full float64 precision
+        meta = meta.astype({k: "category" for k in keys if k in CATEGORICAL_COLUMNS})
+    return fact, meta
+
+
+def new_baselines(meta: pd.DataFrame | None, seen: set) -> pd.DataFrame | None:
+    """
+    Side-table rows whose baseline key is not in `seen` (which is updated),
+    so an artifact written chunk by chunk lists every baseline once.
+    """
+    if meta is None:
+        return None
+    fresh = meta[~meta[BASELINE_KEY].isin(seen)]
+    seen.update(fresh[BASELINE_KEY].tolist())
+    return fresh
+
+
+def expand_scenarios(fact: pd.DataFrame, meta: pd.DataFrame | None) -> pd.DataFrame:
+    """
+    Join the metadata side table back onto a compact fact table.
+    """
+    if meta is None:
+        return fact
+    values = meta[[BASELINE_KEY] + [c for c in meta.columns if c not in fact.columns]]
+    return fact.merge(values, on=BASELINE_KEY, how="left", sort=False).drop(columns=BASELINE_KEY)
+
+
+def memory_report(df: pd.DataFrame, fact: pd.DataFrame, meta: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Per-column in-memory size of the current schema vs the compact one, plus totals.
+    Metadata columns are charged to the side table.
+    """
+    meta = meta if meta is not None else pd.DataFrame()
+    current = df.memory_usage(deep=True, index=False)
+    compact = pd.concat([
+        fact.memory_usage(deep=True, index=False),
+        meta.drop(columns=[c for c in meta.columns if c in fact.columns]).memory_usage(deep=True, index=False)
+    ])
+
+    report = pd.DataFrame({
+        "Column": df.columns,
+        "Current dtype": [str(df[c].dtype) for c in df.columns],
+        "Current bytes": current.reindex(df.columns).to_numpy(),
+        "Compact dtype": [str(fact[c].dtype) if c in fact else f"{meta[c].dtype} (side table)" for c in df.columns],
+        "Compact bytes": compact.reindex(df.columns).fillna(0).astype(int).to_numpy(),
+    })
+    total_compact = int(fact.memory_usage(deep=True, index=False).sum() + meta.memory_usage(deep=True, index=False).sum())
+    totals = pd.DataFrame([{
+        "Column": "TOTAL", "Current dtype": "", "Current bytes": int(current.sum()),
+        "Compact dtype": "", "Compact bytes": total_compact,
+    }])
+    report = pd.concat([report, totals], ignore_index=True)
+    report["Ratio"] = report["Compact bytes"] / report["Current bytes"]
+    return report
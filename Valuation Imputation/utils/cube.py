@@ -0,0 +1,248 @@
+# utils/cube.py
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.scenario_analysis import _resolve_column, _expand, VALUATION_BASES, CROSS_BASIS_EPS_RANGE, CROSS_BASIS_PE_RANGE
+from utils.grids import to_percent
+
+CUBE_VERSION = 1
+DIMS = ("benchmark", "basis", "eps", "pe", "rate")
+
+# Stored arrays, the dimensions each one actually varies over, and its long-format column.
+# Implied price/return do not depend on the rate shock, so they are stored once per
+# (benchmark, basis, eps, pe) and broadcast along `rate` on read instead of repeated.
+FIELDS = {
+    "adjusted_eps": (("benchmark", "basis", "eps"), "Adjusted EPS"),
+    "adjusted_pe": (("benchmark", "basis", "pe"), "Adjusted PE"),
+    "adjusted_rate": (("benchmark", "rate"), "Adjusted Interest Rate"),
+    "implied_price": (("benchmark", "basis", "eps", "pe"), "Implied Index Level"),
+    "implied_return": (("benchmark", "basis", "eps", "pe"), "Implied Return (%)"),
+    "current_eps": (("benchmark", "basis"), "Current EPS"),
+    "current_pe": (("benchmark", "basis"), "Current PE"),
+    "current_price": (("benchmark", "basis"), "Current Index Level"),
+    "current_rate": (("benchmark",), "Current Interest Rate"),
+}
+
+
+class ScenarioCube:
+    """
+    Dense (benchmark, basis, eps, pe[, rate]) form of the cross-basis scenario grid.
+
+    Each field is stored once over the dimensions it varies in (see FIELDS),
+    and `cube[field]` returns it broadcast to the full cube shape as a
+    read-only, zero-copy view. Cells whose basis has missing or non-positive
+    EPS/PE (or, with rates, whose benchmark has no current rate) are NaN and
+    False in `cube.valid`, mirroring the rows cross_basis_scenarios skips.
+
+    `save()` writes a directory with one `.npy` per field and grid plus a
+    `coords.json` with the labels; `ScenarioCube.load(path)` memory-maps it
+    back, so slicing a loaded cube reads only the touched pages. `to_frame()`
+    converts back to the long cross_basis_scenarios layout, value for value.
+    """
+
+    def __init__(self, arrays: dict, valid: np.ndarray, benchmarks, bases, eps_grid, pe_grid, rate_grid=None):
+        self.arrays = arrays
+        self.valid = valid
+        self.benchmarks = list(benchmarks)
+        self.bases = list(bases)
+        self.eps_grid = eps_grid
+        self.pe_grid = pe_grid
+        self.rate_grid = rate_grid
+
+    @classmethod
+    def build(
+        cls,
+        df: pd.DataFrame,
+        bases=VALUATION_BASES,
+        eps_grid=CROSS_BASIS_EPS_RANGE,
+        pe_grid=CROSS_BASIS_PE_RANGE,
+        rate_grid=None
+    ) -> "ScenarioCube":
+        """
+        Compute the cube for every row of `df`; same inputs and arithmetic as cross_basis_scenarios.
+        """
+        with_rates = rate_grid is not None
+
+        benchmark_col = _resolve_column(df, "benchmark_id", "Benchmark")
+        rate_col = _resolve_column(df, "current_interest_rate", "Current Interest Rate")
+        missing = [c for b in bases for c in (f"eps_{b}", f"pe_{b}") if c not in df.columns]
+        if benchmark_col is None:
+            missing.insert(0, "benchmark_id")
+        if with_rates and rate_col is None:
+            missing.append("current_interest_rate")
+        if missing:
+            raise KeyError(f"Missing required columns: {missing}")
+
+        eps_grid = np.asarray(eps_grid)
+        pe_grid = np.asarray(pe_grid)
+        eps = np.column_stack([pd.to_numeric(df[f"eps_{b}"]).to_numpy(dtype=float) for b in bases])
+        pe = np.column_stack([pd.to_numeric(df[f"pe_{b}"]).to_numpy(dtype=float) for b in bases])
+
+        with np.errstate(invalid="ignore"):
+            valid = (eps > 0) & (pe > 0)
+        if with_rates:
+            rate_grid = np.asarray(rate_grid)
+            current_rate = pd.to_numeric(df[rate_col]).to_numpy(dtype=float)
+            valid &= ~np.isnan(current_rate)[:, None]
+        eps = np.where(valid, eps, np.nan)
+        pe = np.where(valid, pe, np.nan)
+
+        base_price = eps * pe
+        adj_eps = eps[:, :, None] * (1 + eps_grid)                           # (n, basis, eps)
+        adj_pe = pe[:, :, None] * (1 + pe_grid)                              # (n, basis, pe)
+        implied_price = adj_eps[:, :, :, None] * adj_pe[:, :, None, :]       # (n, basis, eps, pe)
+        implied_return = (implied_price / base_price[:, :, None, None]) - 1
+
+        arrays = {
+            "adjusted_eps": adj_eps,
+            "adjusted_pe": adj_pe,
+            "implied_price": implied_price,
+            "implied_return": implied_return * 100,
+            "current_eps": eps,
+            "current_pe": pe,
+            "current_price": base_price,
+        }
+        if with_rates:
+            arrays["adjusted_rate"] = current_rate[:, None] + rate_grid / 100.0  # bps → %
+            arrays["current_rate"] = current_rate
+
+        return cls(arrays, valid, df[benchmark_col].tolist(), bases, eps_grid, pe_grid, rate_grid)
+
+    @property
+    def dims(self) -> tuple:
+        return DIMS if self.rate_grid is not None else DIMS[:-1]
+
+    @property
+    def shape(self) -> tuple:
+        shape = (len(self.benchmarks), len(self.bases), len(self.eps_grid), len(self.pe_grid))
+        return shape + ((len(self.rate_grid),) if self.rate_grid is not None else ())
+
+    @property
+    def coords(self) -> dict:
+        # Grid coordinates in the units of the long-format columns (%, bps)
+        coords = {
+            "benchmark": self.benchmarks,
+            "basis": self.bases,
+            "eps": to_percent(self.eps_grid),
+            "pe": to_percent(self.pe_grid),
+        }
+        if self.rate_grid is not None:
+            coords["rate"] = self.rate_grid
+        return coords
+
+    def __len__(self):
+        # Rows of the long format
+        return int(self.valid.sum()) * int(np.prod(self.shape[2:]))
+
+    def __repr__(self):
+        dims = ", ".join(f"{dim}: {size}" for dim, size in zip(self.dims, self.shape))
+        return f"ScenarioCube({dims}; fields: {', '.join(self.arrays)})"
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        """
+        `field` (a FIELDS key or its long-format column name) as a read-only
+        view over the full cube shape.
+        """
+        names = {column: key for key, (_, column) in FIELDS.items()}
+        key = names.get(field, field)
+        if key not in self.arrays:
+            raise KeyError(f"Unknown cube field: {field}")
+        field_dims = FIELDS[key][0]
+        index = tuple(slice(None) if dim in field_dims else None for dim in self.dims)
+        return np.broadcast_to(self.arrays[key][index], self.shape)
+
+    def save(self, path) -> Path:
+        """
+        Write the cube to directory `path`: <field>.npy, valid.npy,
+        eps_grid.npy, pe_grid.npy, rate_grid.npy and coords.json.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for old in path.glob("*.npy"):
+            old.unlink()
+
+        for key, values in self.arrays.items():
+            np.save(path / f"{key}.npy", np.ascontiguousarray(values))
+        np.save(path / "valid.npy", self.valid)
+        np.save(path / "eps_grid.npy", self.eps_grid)
+        np.save(path / "pe_grid.npy", self.pe_grid)
+        if self.rate_grid is not None:
+            np.save(path / "rate_grid.npy", self.rate_grid)
+
+        coords = {
+            "version": CUBE_VERSION,
+            "dims": list(self.dims),
+            "shape": list(self.shape),
+            "benchmark": [str(b) for b in self.benchmarks],
+            "basis": self.bases,
+            "fields": {key: list(FIELDS[key][0]) for key in self.arrays},
+        }
+        (path / "coords.json").write_text(json.dumps(coords, indent=2))
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode="r") -> "ScenarioCube":
+        """
+        Open a saved cube. Arrays are memory-mapped by default; pass
+        `mmap_mode=None` to read them fully into memory.
+        """
+        path = Path(path)
+        coords = json.loads((path / "coords.json").read_text())
+        if coords.get("version") != CUBE_VERSION:
+            raise ValueError(f"Unsupported cube version {coords.get('version')} in {path}")
+
+        arrays = {key: np.load(path / f"{key}.npy", mmap_mode=mmap_mode) for key in coords["fields"]}
+        rate_path = path / "rate_grid.npy"
+        return cls(
+            arrays,
+            np.load(path / "valid.npy", mmap_mode=mmap_mode),
+            coords["benchmark"],
+            coords["basis"],
+            np.load(path / "eps_grid.npy"),
+            np.load(path / "pe_grid.npy"),
+            np.load(rate_path) if rate_path.exists() else None
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Long format with the cross_basis_scenarios columns and row order
+        (benchmark → basis → eps → pe → rate), valid cells only.
+        """
+        with_rates = self.rate_grid is not None
+        row_idx, basis_idx = np.nonzero(self.valid)
+        shape = (len(row_idx),) + self.shape[2:]
+
+        def expand(key, axes):
+            values = self.arrays[key]
+            values = values[row_idx, basis_idx] if "basis" in FIELDS[key][0] else values[row_idx]
+            return _expand(values, axes, shape)
+
+        basis_labels = np.asarray(self.bases, dtype=object)[basis_idx]
+        columns = {
+            "Benchmark": _expand(np.asarray(self.benchmarks, dtype=object)[row_idx], (0,), shape),
+            "EPS Type": _expand(basis_labels, (0,), shape),
+            "PE Type": _expand(basis_labels, (0,), shape),
+            "EPS Change (%)": _expand(to_percent(self.eps_grid), (1,), shape),
+            "PE Change (%)": _expand(to_percent(self.pe_grid), (2,), shape),
+        }
+        if with_rates:
+            columns["Interest Rate Change (bps)"] = _expand(self.rate_grid, (3,), shape)
+
+        columns["Adjusted EPS"] = expand("adjusted_eps", (0, 1))
+        columns["Adjusted PE"] = expand("adjusted_pe", (0, 2))
+        if with_rates:
+            columns["Adjusted Interest Rate"] = expand("adjusted_rate", (0, 3))
+        columns["Implied Index Level"] = expand("implied_price", (0, 1, 2))
+        columns["Implied Return (%)"] = expand("implied_return", (0, 1, 2))
+
+        columns["Current EPS"] = expand("current_eps", (0,))
+        columns["Current PE"] = expand("current_pe", (0,))
+        columns["Current Index Level"] = expand("current_price", (0,))
+        if with_rates:
+            columns["Current Interest Rate"] = expand("current_rate", (0,))
+
+        return pd.DataFrame(columns)
@@ -0,0 +1,117 @@
+# utils/executor.py
+
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from utils.profiling import run_stage
+
+
+class Stage:
+    """
+    One node of the pipeline DAG.
+
+    `func` is called as func(*args, *[results of deps], **kwargs) so downstream
+    stages can consume upstream results. Functions must be module-level to be
+    picklable when the stage runs in a worker process.
+    """
+
+    def __init__(self, name, func, args=(), deps=(), kwargs=None):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.deps = tuple(deps)
+        self.kwargs = kwargs or {}
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={list(self.deps)})"
+
+
+def _check_dag(stages):
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique")
+    known = set(names)
+    for stage in stages:
+        unknown = [d for d in stage.deps if d not in known]
+        if unknown:
+            raise ValueError(f"Stage {stage.name!r} depends on unknown stages: {unknown}")
+
+
+def run_stages(stages, workers: int = 1, recorder=None) -> dict:
+    """
+    Run a list of Stages respecting their dependencies and return {name: result}.
+
+    With workers <= 1 stages run serially in the parent process, in list order
+    as far as dependencies allow. Otherwise every stage whose dependencies are
+    done is submitted to a process pool of `workers` processes. Each stage
+    writes its own outputs, so results do not depend on completion order.
+
+    With a `recorder` (utils.profiling.StageRecorder) every stage is timed in
+    the process that runs it and its records are collected into the recorder.
+    """
+    _check_dag(stages)
+    pending = list(stages)
+    results = {}
+    options = recorder.options() if recorder is not None else None
+
+    def task(stage):
+        # (func, args, kwargs) to call; recorded stages also return their records
+        if recorder is None:
+            return stage.func, call_args(stage), stage.kwargs
+        return run_stage, (stage.name, stage.func, call_args(stage), stage.kwargs, options), {}
+
+    def collect(outcome):
+        if recorder is None:
+            return outcome
+        result, records = outcome
+        recorder.records.extend(records)
+        return result
+
+    def ready(stage):
+        return all(d in results for d in stage.deps)
+
+    def call_args(stage):
+        return stage.args + tuple(results[d] for d in stage.deps)
+
+    if workers <= 1:
+        while pending:
+            stage = next((s for s in pending if ready(s)), None)
+            if stage is None:
+                raise ValueError(f"Dependency cycle between stages: {pending}")
+            pending.remove(stage)
+            logging.info(f"Running stage: {stage.name}")
+            func, args, kwargs = task(stage)
+            results[stage.name] = collect(func(*args, **kwargs))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while pending or running:
+            for stage in [s for s in pending if ready(s)]:
+                pending.remove(stage)
+                logging.info(f"Submitting stage: {stage.name}")
+                func, args, kwargs = task(stage)
+                running[pool.submit(func, *args, **kwargs)] = stage.name
+
+            if not running:
+                raise ValueError(f"Dependency cycle between stages: {pending}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = collect(future.result())
+                logging.info(f"Finished stage: {name}")
+
+    return results
+
+
+def shard_rows(df, n_shards: int) -> list:
+    """
+    Split `df` into at most `n_shards` contiguous row blocks, preserving row order,
+    so concatenating per-shard outputs reproduces a serial run exactly.
+    """
+    n_shards = max(1, min(n_shards, len(df)))
+    bounds = np.linspace(0, len(df), n_shards + 1).astype(int)
+    return [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
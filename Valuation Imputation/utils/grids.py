@@ -0,0 +1,67 @@
+# utils/grids.py
+
+import numpy as np
+
+from config import GRID_SPECS
+
+# Integer grid unit → divisor that turns it into the value the generators compute with
+UNIT_SCALES = {
+    "pct": 100,  # percent change → fraction (10 → 0.1)
+    "bps": 1,    # basis points, used as is
+    "pe": 1,     # P/E points, used as is
+}
+
+
+class GridSpec:
+    """
+    Integer-step scenario grid: the integers start, start + step, …, stop in
+    `unit` ("pct", "bps" or "pe"). `units` holds those integers and `values`
+    the numbers the generators compute with (fractions for percent grids).
+    Every value comes from a single division of an exact integer, so there is
+    no accumulated float drift. The arrays are built once, are read-only and
+    can be shared by every generator. np.asarray(spec) gives `values`, so a
+    GridSpec can be passed anywhere a grid array is accepted.
+    """
+
+    def __init__(self, start: int, stop: int, step: int, unit: str = "pct"):
+        if not all(isinstance(v, (int, np.integer)) for v in (start, stop, step)):
+            raise ValueError(f"Grid bounds and step must be integers, got ({start}, {stop}, {step})")
+        if step <= 0 or stop < start or (stop - start) % step:
+            raise ValueError(f"Grid {start}..{stop} cannot be covered in whole steps of {step}")
+        if unit not in UNIT_SCALES:
+            raise ValueError(f"Unknown grid unit {unit!r}; expected one of {list(UNIT_SCALES)}")
+
+        self.start, self.stop, self.step, self.unit = int(start), int(stop), int(step), unit
+        self.units = np.arange(self.start, self.stop + self.step, self.step, dtype=np.int64)
+        scale = UNIT_SCALES[unit]
+        self.values = self.units / scale if scale != 1 else self.units.copy()
+        self.units.setflags(write=False)
+        self.values.setflags(write=False)
+
+    def __len__(self):
+        return len(self.units)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.values, dtype=dtype)
+
+    def __repr__(self):
+        return f"GridSpec({self.start}, {self.stop}, {self.step}, {self.unit!r})"
+
+
+def to_percent(values) -> np.ndarray:
+    """
+    Fractions → percent labels (0.3 → 30.0), rounded so products like
+    0.07 * 100 = 7.000000000000001 come out as the intended 7.0.
+    """
+    return np.round(np.asarray(values, dtype=float) * 100, 9)
+
+
+def load_grids(specs: dict = GRID_SPECS) -> dict:
+    """
+    {name: GridSpec} from (start, stop, step, unit) tuples, e.g. GRID_SPECS in config.py.
+    """
+    return {name: GridSpec(*spec) for name, spec in specs.items()}
+
+
+# Built once per run and shared by every generator
+GRIDS = load_grids()
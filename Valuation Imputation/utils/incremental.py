@@ -0,0 +1,71 @@
+# utils/incremental.py
+
+import pandas as pd
+
+KEY_COLUMNS = ["benchmark_id", "date"]
+
+
+def fingerprint_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per input row: its (benchmark_id, date) key and a 64-bit hash of all its values.
+    """
+    missing = [c for c in KEY_COLUMNS if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+
+    fingerprint = df[KEY_COLUMNS].copy()
+    fingerprint["date"] = pd.to_datetime(fingerprint["date"])
+    # Hash with sorted column names so a reordered input file does not look changed
+    fingerprint["row_hash"] = pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()
+    return fingerprint
+
+
+def load_manifest(path) -> pd.DataFrame | None:
+    """
+    Fingerprints recorded by the previous run, or None if there is no manifest yet.
+    """
+    try:
+        manifest = pd.read_csv(path, parse_dates=["date"], dtype={"benchmark_id": str, "row_hash": "uint64"})
+    except FileNotFoundError:
+        return None
+    return manifest
+
+
+def save_manifest(fingerprint: pd.DataFrame, path):
+    fingerprint.to_csv(path, index=False)
+
+
+def changed_rows(fingerprint: pd.DataFrame, manifest: pd.DataFrame) -> pd.Series:
+    """
+    Boolean mask over the current input rows: True where the (benchmark_id, date)
+    key is new or its value hash differs from the manifest.
+    """
+    previous = manifest.drop_duplicates(KEY_COLUMNS, keep="last").rename(columns={"row_hash": "previous_hash"})
+    merged = fingerprint.merge(previous, on=KEY_COLUMNS, how="left")
+    return pd.Series((merged["row_hash"] != merged["previous_hash"]).to_numpy(), index=fingerprint.index)
+
+
+def removed_keys(fingerprint: pd.DataFrame, manifest: pd.DataFrame) -> pd.DataFrame:
+    """
+    (benchmark_id, date) keys in the manifest that are no longer in the
+    input, i.e. rows deleted since the last run, whose outputs must be dropped.
+    """
+    def keys(df):
+        return pd.MultiIndex.from_arrays([
+            df["benchmark_id"].astype(str).to_numpy(),
+            pd.to_datetime(df["date"]).to_numpy().astype("datetime64[ns]"),
+        ])
+
+    previous = manifest[KEY_COLUMNS].drop_duplicates(ignore_index=True)
+    return previous[~keys(previous).isin(keys(fingerprint))].reset_index(drop=True)
+
+
+def replacement_keys(df: pd.DataFrame, by_date: bool = True) -> pd.DataFrame:
+    """
+    Output-side (display name) keys identifying the artifact rows that `df` replaces:
+    (Benchmark, Date) for row-level outputs, Benchmark only for per-benchmark grids.
+    """
+    keys = pd.DataFrame({"Benchmark": df["benchmark_id"].to_numpy()})
+    if by_date:
+        keys["Date"] = pd.to_datetime(df["date"]).to_numpy()
+    return keys.drop_duplicates(ignore_index=True)
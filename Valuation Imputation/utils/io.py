@@ -1,18 +1,535 @@
+import os
+import shutil
+from pathlib import Path
 import pandas as pd
-from config import SUPPORTED_FORMATS
+from config import SUPPORTED_FORMATS, CSV_ENGINE, OUTPUT_DIR, OUTPUT_FORMAT, CATEGORICAL_COLUMNS, PARTITION_COLUMNS
+from utils.profiling import recorded
 
-def load_data(filepath):
+OUTPUT_FORMATS = ["csv", "parquet", "feather"]
+OUTPUT_DIR_ENV = "VALUATION_OUTPUT_DIR"
+
+# Per-run override (set_output_dir); read back from the environment in spawned worker processes
+OUTPUT_DIR = Path(os.environ.get(OUTPUT_DIR_ENV, OUTPUT_DIR))
+
+
+def set_output_dir(path):
+    """
+    Write every artifact of this run to `path` (created if needed). The
+    directory is also exported in VALUATION_OUTPUT_DIR, so worker processes
+    that re-import this module resolve the same one.
+    """
+    global OUTPUT_DIR
+    OUTPUT_DIR = Path(path)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    os.environ[OUTPUT_DIR_ENV] = str(OUTPUT_DIR)
+
+def input_schema(float_dtype="float64") -> dict:
+    """
+    Declared input schema: every raw column in FIELD_NAME_MAP with its dtype.
+    `date` is parsed as a datetime, `benchmark_id` as a string, the rest as `float_dtype`.
+    """
+    from utils.field_mappings import FIELD_NAME_MAP
+
+    schema = {}
+    for col in FIELD_NAME_MAP:
+        if col == "date":
+            schema[col] = "datetime64[ns]"
+        elif col == "benchmark_id":
+            schema[col] = "str"
+        else:
+            schema[col] = float_dtype
+    return schema
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _filter_rows(df, start_date=None, end_date=None, benchmarks=None):
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None:
+        mask &= df["date"] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= df["date"] <= pd.Timestamp(end_date)
+    if benchmarks is not None:
+        mask &= df["benchmark_id"].isin(list(benchmarks))
+    return df if mask.all() else df.loc[mask].reset_index(drop=True)
+
+
+def load_data(filepath, columns=None, float_dtype="float64", engine=CSV_ENGINE,
+              start_date=None, end_date=None, benchmarks=None):
     """
     Load data from a file based on its extension.
-    Supported formats: .csv, .xlsx, .xls, .parquet
+    Supported formats: .csv, .xlsx, .xls, .parquet, .feather
+
+    `columns` projects the read onto the given raw columns so a stage only parses
+    what it needs. Columns in the declared schema (input_schema) get explicit
+    dtypes, with `float_dtype` for all numeric fields. CSVs are parsed with
+    `engine` ("pyarrow", "c" or "auto" = pyarrow when installed). Parquet and
+    Feather are read memory-mapped. `start_date`/`end_date`/`benchmarks`
+    filter rows, pushed down into the Parquet reader where possible.
     """
     ext = str(filepath).lower().split(".")[-1]
+    schema = input_schema(float_dtype)
+    columns = list(columns) if columns is not None else None
 
     if ext == "csv":
-        return pd.read_csv(filepath, parse_dates=["date"])
+        if engine == "auto":
+            engine = "pyarrow" if _has_pyarrow() else "c"
+        header = pd.read_csv(filepath, nrows=0).columns
+        selected = [c for c in header if columns is None or c in columns]
+        dtype = {c: schema[c] for c in selected if c in schema and c != "date"}
+        df = pd.read_csv(
+            filepath, usecols=columns, dtype=dtype, engine=engine,
+            parse_dates=["date"] if "date" in selected else None,
+            # Correctly rounded floats, matching the pyarrow parser and chunked reads
+            float_precision="round_trip" if engine == "c" else None
+        )
     elif ext in ["xlsx", "xls"]:
-        return pd.read_excel(filepath, parse_dates=["date"])
+        df = pd.read_excel(filepath, usecols=columns, parse_dates=["date"])
     elif ext == "parquet":
-        return pd.read_parquet(filepath)
+        filters = []
+        if start_date is not None:
+            filters.append(("date", ">=", pd.Timestamp(start_date)))
+        if end_date is not None:
+            filters.append(("date", "<=", pd.Timestamp(end_date)))
+        if benchmarks is not None:
+            filters.append(("benchmark_id", "in", list(benchmarks)))
+        df = pd.read_parquet(filepath, columns=columns, filters=filters or None, memory_map=True)
+    elif ext == "feather":
+        from pyarrow import feather
+        df = feather.read_table(filepath, columns=columns, memory_map=True).to_pandas()
     else:
-        raise ValueError(f"Unsupported file format: {ext}")
\ No newline at end of file
+        raise ValueError(f"Unsupported file format: {ext}")
+
+    # Binary formats carry their own dtypes; align numeric fields with the requested width
+    numeric = {c: float_dtype for c, t in schema.items() if c in df.columns and t == float_dtype and df[c].dtype != float_dtype}
+    if numeric:
+        df = df.astype(numeric)
+
+    return _filter_rows(df, start_date, end_date, benchmarks)
+
+
+def iter_data(filepath, chunk_size, columns=None, float_dtype="float64"):
+    """
+    Stream an input file as DataFrame chunks of at most `chunk_size` rows, so
+    files larger than memory can be processed piece by piece. CSVs are read
+    with pandas' chunked parser, Parquet by record batches across row groups,
+    Feather by record batch (re-sliced to `chunk_size`). Applies the same
+    column projection and dtypes as load_data.
+    """
+    ext = str(filepath).lower().split(".")[-1]
+    schema = input_schema(float_dtype)
+    columns = list(columns) if columns is not None else None
+
+    def align(df):
+        numeric = {c: float_dtype for c, t in schema.items() if c in df.columns and t == float_dtype and df[c].dtype != float_dtype}
+        return df.astype(numeric) if numeric else df
+
+    if ext == "csv":
+        header = pd.read_csv(filepath, nrows=0).columns
+        selected = [c for c in header if columns is None or c in columns]
+        dtype = {c: schema[c] for c in selected if c in schema and c != "date"}
+        reader = pd.read_csv(
+            filepath, usecols=columns, dtype=dtype, chunksize=chunk_size,
+            parse_dates=["date"] if "date" in selected else None, float_precision="round_trip"
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk
+    elif ext == "parquet":
+        _require_pyarrow("Chunked Parquet input")
+        import pyarrow.parquet as pq
+
+        source = pq.ParquetFile(filepath, memory_map=True)
+        for batch in source.iter_batches(batch_size=chunk_size, columns=columns):
+            yield align(batch.to_pandas())
+    elif ext == "feather":
+        _require_pyarrow("Chunked Feather input")
+        import pyarrow as pa
+
+        with pa.memory_map(str(filepath)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for start in range(0, batch.num_rows, chunk_size):
+                    yield align(batch.slice(start, chunk_size).to_pandas())
+    else:
+        raise ValueError(f"Unsupported format for chunked input: {ext}")
+
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(f"{fmt} output requires pyarrow") from e
+
+
+def encode_labels(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert repeated label columns (CATEGORICAL_COLUMNS) to pandas categoricals,
+    which Parquet/Feather store dictionary-encoded.
+    """
+    labels = [
+        col for col in CATEGORICAL_COLUMNS
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+    if not labels:
+        return df
+    # Replace the label columns on a shallow copy; the other columns are shared with `df`
+    encoded = df.copy(deep=False)
+    for col in labels:
+        encoded[col] = df[col].astype("category")
+    return encoded
+
+
+def output_path(name: str, fmt: str = OUTPUT_FORMAT):
+    return OUTPUT_DIR / f"{name}.{fmt}"
+
+
+@recorded("write")
+def save_output(df: pd.DataFrame, name: str, index: bool = False, partition: bool = False, fmt: str = OUTPUT_FORMAT):
+    """
+    Write a pipeline artifact to OUTPUT_DIR using the configured backend.
+
+    `name` is the file stem; the extension follows `fmt` (OUTPUT_FORMAT by default).
+    For Parquet, `partition=True` writes a dataset directory partitioned by
+    PARTITION_COLUMNS so readers can load a single benchmark without scanning
+    the whole table. Feather has no partitioning and ignores the flag.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+
+    path = output_path(name, fmt)
+
+    if fmt == "csv":
+        df.to_csv(path, index=index)
+        return path
+
+    _require_pyarrow(fmt)
+    if index:
+        df = df.reset_index()
+    # Arrow needs string column names (return matrices use dates as columns)
+    if not all(isinstance(c, str) for c in df.columns):
+        df = df.copy(deep=False)
+        df.columns = [str(c) for c in df.columns]
+    df = encode_labels(df)
+
+    if fmt == "feather":
+        df.to_feather(path)
+        return path
+
+    partition_cols = [c for c in PARTITION_COLUMNS if c in df.columns] if partition else []
+    _clear_path(path)
+    if partition_cols:
+        df.to_parquet(path, index=False, partition_cols=partition_cols)
+    else:
+        df.to_parquet(path, index=False)
+    return path
+
+
+def read_output(name: str, fmt: str = OUTPUT_FORMAT, filters=None) -> pd.DataFrame:
+    """
+    Read a pipeline artifact back from OUTPUT_DIR. `filters` (Parquet only) limits
+    the read to matching partitions, e.g. [("Benchmark", "in", ["S&P 500"])].
+    """
+    path = output_path(name, fmt)
+    if fmt == "csv":
+        # round_trip parsing so merged artifacts keep the written values bit for bit
+        df = pd.read_csv(path, float_precision="round_trip")
+        if "Date" in df.columns:
+            df["Date"] = pd.to_datetime(df["Date"])
+        return df
+    if fmt == "feather":
+        return pd.read_feather(path)
+    return pd.read_parquet(path, filters=filters)
+
+
+def _normalize_keys(df: pd.DataFrame, keys) -> pd.DataFrame:
+    # Compare dates as datetimes and labels as plain strings regardless of the backend dtype
+    return pd.DataFrame({
+        k: pd.to_datetime(df[k]).to_numpy() if k == "Date" else df[k].astype(str).to_numpy()
+        for k in keys
+    })
+
+
+@recorded("merge")
+def merge_output(df: pd.DataFrame, name: str, replace: pd.DataFrame, partition: bool = False, fmt: str = OUTPUT_FORMAT):
+    """
+    Merge freshly computed rows into an existing artifact.
+
+    Rows of the existing output whose key columns (the columns of `replace`)
+    match a row of `replace` are dropped and `df` is appended, so the result
+    matches a fresh save up to row order. Only partitioned Parquet reads and
+    rewrites just the affected benchmarks' partitions; CSV and unpartitioned
+    artifacts are read and rewritten in full on every merge. Falls back to a
+    plain save when the artifact does not exist yet.
+    """
+    path = output_path(name, fmt)
+    if not path.exists():
+        return save_output(df, name, partition=partition, fmt=fmt)
+
+    keys = list(replace.columns)
+    partitioned = partition and fmt == "parquet" and path.is_dir()
+    filters = [("Benchmark", "in", replace["Benchmark"].astype(str).unique().tolist())] if partitioned else None
+
+    existing = read_output(name, fmt, filters=filters)
+    stale = pd.MultiIndex.from_frame(_normalize_keys(existing, keys)).isin(
+        pd.MultiIndex.from_frame(_normalize_keys(replace, keys))
+    )
+    # Align label dtypes (categorical on read-back) before stacking old and new rows
+    existing = existing.loc[~stale].astype({c: "object" for c in existing.columns if isinstance(existing[c].dtype, pd.CategoricalDtype)})
+    # CSV reads numbers back as int64/float64; take the new rows' dtypes (e.g. compact float32/int16)
+    # so stacking does not upcast them and write float32 values with float64 noise
+    existing = existing.astype({
+        c: df[c].dtype for c in df.columns
+        if c in existing.columns and existing[c].dtype != df[c].dtype
+        and pd.api.types.is_numeric_dtype(df[c]) and pd.api.types.is_numeric_dtype(existing[c])
+        and (pd.api.types.is_float_dtype(df[c]) or not existing[c].isna().any())
+    })
+    # An empty frame of new rows would turn typed columns (e.g. Date) into object
+    merged = pd.concat([existing, df], ignore_index=True) if len(df) else existing.reset_index(drop=True)
+
+    if not partitioned:
+        return save_output(merged, name, partition=partition, fmt=fmt)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Only the affected benchmarks' partitions are replaced; the rest of the dataset is untouched.
+    # They are dropped first so partitions left without rows (deleted input) do not survive.
+    _drop_partitions(path, filters)
+    partition_cols = [c for c in PARTITION_COLUMNS if c in merged.columns]
+    if len(merged):
+        pq.write_to_dataset(
+            pa.Table.from_pandas(encode_labels(merged), preserve_index=False), path,
+            partition_cols=partition_cols, existing_data_behavior="overwrite_or_ignore"
+        )
+    return path
+
+
+def _drop_partitions(path, filters):
+    # Remove the dataset files matching `filters`, then any partition directories left empty
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    for fragment in dataset.get_fragments(filter=pq.filters_to_expression(filters)):
+        os.remove(fragment.path)
+    for root, dirs, files in os.walk(path, topdown=False):
+        if root != str(path) and not os.listdir(root):
+            os.rmdir(root)
+
+
+def _clear_path(path):
+    # Partitioned datasets append new files on write, so drop the previous run first.
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def _stream_schema(df: pd.DataFrame, dictionary: bool = True):
+    """
+    Arrow schema every chunk of a stream is cast to, fixed from the first
+    chunk with rows. Label (dictionary) columns get int32 indices over
+    strings, whatever index width the first chunk's categories needed, and
+    all-null columns are typed as labels or float64 rather than Arrow's null
+    type, which later chunks cannot be cast to. With `dictionary=False`
+    (Feather) labels are plain strings.
+    """
+    import pyarrow as pa
+
+    label = pa.dictionary(pa.int32(), pa.string()) if dictionary else pa.string()
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(label)
+        elif pa.types.is_null(field.type):
+            field = field.with_type(label if field.name in CATEGORICAL_COLUMNS else pa.float64())
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+class ChunkWriter:
+    """
+    Append DataFrame chunks to a single CSV, Parquet or Feather output as they arrive.
+
+    CSV targets may be a path or an open text stream (e.g. sys.stdout), so output
+    can be piped to a downstream consumer before the run finishes; the stream is
+    flushed after every chunk. Parquet targets write one row group per chunk, or
+    one file per chunk and partition when `partition_cols` is given. Feather
+    targets write one record batch per chunk. Parquet and Feather require pyarrow.
+
+    `part_prefix` and `overwrite=False` let several writers (e.g. one per worker
+    shard) add uniquely named files to the same partitioned Parquet dataset.
+    """
+
+    def __init__(self, target, fmt=None, partition_cols=None, part_prefix="part", overwrite=True):
+        if fmt is None:
+            fmt = str(target).lower().split(".")[-1] if not hasattr(target, "write") else "csv"
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported streaming format: {fmt}")
+        if fmt != "csv":
+            _require_pyarrow(fmt)
+
+        self.target = target
+        self.fmt = fmt
+        self.partition_cols = partition_cols or []
+        self.part_prefix = part_prefix
+        self.overwrite = overwrite
+        self.rows_written = 0
+        self._started = False
+        self._arrow_writer = None
+        self._schema = None
+        self._empty = None
+        self._chunks = 0
+
+    def write(self, df: pd.DataFrame):
+        if self.fmt == "csv":
+            mode = "a" if self._started else "w"
+            df.to_csv(self.target, mode=mode, header=not self._started, index=False)
+            if hasattr(self.target, "flush"):
+                self.target.flush()
+        elif self.fmt == "parquet":
+            self._write_arrow(encode_labels(df))
+        else:
+            # Feather files allow one dictionary per column, and each chunk's categoricals
+            # (compact output) bring their own categories, so stream labels as plain strings
+            self._write_arrow(df.astype({c: "object" for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)}))
+
+        self._started = True
+        self._chunks += 1
+        self.rows_written += len(df)
+
+    def _write_arrow(self, df: pd.DataFrame, final: bool = False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._schema is None:
+            if not len(df) and not final:
+                # An empty chunk says nothing about the column types; wait for rows (see close)
+                self._empty = df
+                return
+            self._schema = _stream_schema(df, dictionary=self.fmt == "parquet")
+            if self.overwrite:
+                _clear_path(Path(self.target))
+        # Cast every chunk to the stream schema so all pieces line up.
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+
+        if self.fmt == "parquet" and self.partition_cols:
+            pq.write_to_dataset(
+                table, self.target, partition_cols=self.partition_cols,
+                basename_template=f"{self.part_prefix}-{self._chunks:05d}-{{i}}.parquet"
+            )
+            return
+
+        if self._arrow_writer is None:
+            if self.fmt == "parquet":
+                self._arrow_writer = pq.ParquetWriter(self.target, self._schema)
+            else:
+                self._arrow_writer = pa.ipc.new_file(str(self.target), self._schema)
+        self._arrow_writer.write_table(table)
+
+    def close(self):
+        if self._schema is None and self._empty is not None:
+            # Only empty chunks arrived: still write the (empty) artifact
+            self._write_arrow(self._empty, final=True)
+        if self._arrow_writer is not None:
+            self._arrow_writer.close()
+            self._arrow_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_chunks(chunks, target, fmt=None, partition_cols=None) -> int:
+    """
+    Consume an iterable of DataFrame chunks and append each one to `target`.
+    Returns the total number of rows written.
+    """
+    with ChunkWriter(target, fmt, partition_cols) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return writer.rows_written
+
+
+def open_output_writer(name: str, partition: bool = False, fmt: str = OUTPUT_FORMAT, part: int | None = None) -> ChunkWriter:
+    """
+    ChunkWriter for a streamed pipeline artifact in OUTPUT_DIR using the configured backend.
+
+    With `part`, the writer produces shard `part` of the artifact: its own part
+    file for merge_output_parts to stitch together, or uniquely named files in
+    the shared dataset when writing partitioned Parquet.
+    """
+    partition_cols = PARTITION_COLUMNS if (partition and fmt == "parquet") else None
+    if part is None:
+        return ChunkWriter(output_path(name, fmt), fmt, partition_cols)
+    if partition_cols:
+        return ChunkWriter(output_path(name, fmt), fmt, partition_cols, part_prefix=f"part-{part:05d}", overwrite=False)
+    return ChunkWriter(_part_path(name, part, fmt), fmt)
+
+
+def _part_path(name: str, part: int, fmt: str):
+    return OUTPUT_DIR / f"{name}.part-{part:05d}.{fmt}"
+
+
+def clear_output(name: str, fmt: str = OUTPUT_FORMAT):
+    _clear_path(output_path(name, fmt))
+
+
+def merge_output_parts(name: str, n_parts: int, partition: bool = False, fmt: str = OUTPUT_FORMAT):
+    """
+    Stitch shard part files written via open_output_writer(part=...) into the
+    final artifact, in shard order, and remove the parts. The result is identical
+    to streaming every shard through a single writer.
+    """
+    target = output_path(name, fmt)
+    if partition and fmt == "parquet":
+        return target  # shards already wrote into the shared dataset
+
+    # Shards with no valid rows never open their part file
+    parts = [p for p in (_part_path(name, i, fmt) for i in range(n_parts)) if p.exists()]
+    _clear_path(target)
+
+    if fmt == "csv":
+        with open(target, "wb") as out:
+            for i, part in enumerate(parts):
+                with open(part, "rb") as src:
+                    if i > 0:
+                        src.readline()  # keep only the first header
+                    shutil.copyfileobj(src, out)
+    elif parts:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        for part in parts:
+            if fmt == "parquet":
+                source = pq.ParquetFile(part)
+                tables = (source.read_row_group(i) for i in range(source.num_row_groups))
+                schema = source.schema_arrow
+            else:
+                source = pa.ipc.open_file(part)
+                tables = (pa.Table.from_batches([source.get_batch(i)]) for i in range(source.num_record_batches))
+                schema = source.schema
+            if writer is None:
+                target_schema = schema
+                writer = pq.ParquetWriter(target, schema) if fmt == "parquet" else pa.ipc.new_file(str(target), schema)
+            for table in tables:
+                writer.write_table(table.cast(target_schema))
+        writer.close()
+
+    for part in parts:
+        part.unlink()
+    return target
@@ -0,0 +1,227 @@
+# utils/monte_carlo.py
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    MC_PATHS, MC_BLOCK_SIZE, MC_SEED, MC_SHOCKS, MC_CORRELATION, MC_RATE_PASS_THROUGH, MC_RATE_FLOOR,
+    MC_QUANTILES, MC_VAR_LEVELS
+)
+from utils.executor import Stage, run_stages, shard_rows
+from utils.scenario_analysis import _resolve_column, VALUATION_BASES
+
+SHOCK_NAMES = ("eps", "pe", "rate_bps")
+
+
+def _cholesky(correlation) -> np.ndarray:
+    correlation = np.asarray(correlation, dtype=float)
+    if correlation.shape != (3, 3) or not np.allclose(correlation, correlation.T):
+        raise ValueError(f"Correlation must be a symmetric 3x3 matrix over {SHOCK_NAMES}")
+    try:
+        return np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+        raise ValueError("Correlation matrix is not positive definite")
+
+
+def _row_seed(seed: int, benchmark, day: int) -> np.random.SeedSequence:
+    """
+    Per benchmark/date stream, so results do not depend on batching or sharding.
+    `day` is the date as days since 1970-01-01, so the draws do not depend on
+    how the input stores dates, and the 128-bit digest keeps distinct rows on
+    distinct streams at universe scale.
+    """
+    digest = hashlib.blake2b(f"{benchmark}|{int(day)}".encode(), digest_size=16).digest()
+    return np.random.SeedSequence([seed, *np.frombuffer(digest, dtype=np.uint32).tolist()])
+
+
+class _Inputs:
+    """
+    Validated base values for the rows that have a current rate and at least one usable basis.
+    """
+
+    def __init__(self, df, bases):
+        benchmark_col = _resolve_column(df, "benchmark_id", "Benchmark")
+        date_col = _resolve_column(df, "date", "Date")
+        rate_col = _resolve_column(df, "current_interest_rate", "Current Interest Rate")
+        missing = [c for b in bases for c in (f"eps_{b}", f"pe_{b}") if c not in df.columns]
+        for name, col in [("current_interest_rate", rate_col), ("date", date_col), ("benchmark_id", benchmark_col)]:
+            if col is None:
+                missing.insert(0, name)
+        if missing:
+            raise KeyError(f"Missing required columns: {missing}")
+
+        eps = np.column_stack([pd.to_numeric(df[f"eps_{b}"]).to_numpy(dtype=float) for b in bases])
+        pe = np.column_stack([pd.to_numeric(df[f"pe_{b}"]).to_numpy(dtype=float) for b in bases])
+        rate = pd.to_numeric(df[rate_col]).to_numpy(dtype=float)
+        with np.errstate(invalid="ignore"):
+            valid = (eps > 0) & (pe > 0) & ~np.isnan(rate)[:, None]
+        rows = valid.any(axis=1)
+
+        self.bases = list(bases)
+        self.benchmark = df[benchmark_col].to_numpy(dtype=object)[rows]
+        self.date = df[date_col].to_numpy()[rows]
+        self.day = pd.to_datetime(df[date_col]).to_numpy().astype("datetime64[D]").astype(np.int64)[rows]
+        self.eps, self.pe, self.rate, self.valid = eps[rows], pe[rows], rate[rows], valid[rows]
+
+
+def _simulate(inputs, rows, paths, seed, shocks, chol, pass_through, rate_floor):
+    """
+    Implied returns (fractions) of shape (rows, bases, paths) for a slice of input rows.
+
+    Correlated standard normals drive log EPS growth, log P/E change and a rate
+    move in bps. The rate move, floored at `rate_floor`, shifts the earnings
+    yield by `pass_through` × Δrate, which moves log P/E by ≈ -PE × Δyield.
+    """
+    z = np.empty((len(inputs.benchmark[rows]), paths, 3))
+    for i, (benchmark, day) in enumerate(zip(inputs.benchmark[rows], inputs.day[rows])):
+        np.random.default_rng(_row_seed(seed, benchmark, day)).standard_normal(out=z[i])
+    z = z @ chol.T
+
+    (eps_mu, eps_sd), (pe_mu, pe_sd), (rate_mu, rate_sd) = (shocks[name] for name in SHOCK_NAMES)
+    eps_growth = eps_mu + eps_sd * z[..., 0]                               # (r, paths)
+    pe_change = pe_mu + pe_sd * z[..., 1]
+    rate = inputs.rate[rows][:, None]
+    new_rate = np.maximum(rate + (rate_mu + rate_sd * z[..., 2]) / 100.0, rate_floor)  # bps → %
+    yield_change = pass_through * (new_rate - rate) / 100.0                # % → decimal
+
+    pe = inputs.pe[rows][:, :, None]                                       # (r, bases, 1)
+    log_return = (eps_growth + pe_change)[:, None, :] - pe * yield_change[:, None, :]
+    return np.expm1(log_return)
+
+
+def _batches(inputs, paths, block_size):
+    # Row slices of at most block_size path cells (at least one row each)
+    step = max(1, block_size // paths)
+    for start in range(0, len(inputs.benchmark), step):
+        yield slice(start, start + step)
+
+
+def _quantile_label(q) -> str:
+    return f"P{q * 100:g}"
+
+
+def monte_carlo_summary(
+    df: pd.DataFrame,
+    bases=VALUATION_BASES,
+    paths: int = MC_PATHS,
+    seed: int = MC_SEED,
+    shocks: dict = MC_SHOCKS,
+    correlation=MC_CORRELATION,
+    quantiles=MC_QUANTILES,
+    var_levels=MC_VAR_LEVELS,
+    block_size: int = MC_BLOCK_SIZE,
+    pass_through: float = MC_RATE_PASS_THROUGH,
+    rate_floor: float = MC_RATE_FLOOR,
+    workers: int = 1
+) -> pd.DataFrame:
+    """
+    Simulated return distribution per benchmark, date and basis.
+
+    Each row of `df` draws `paths` correlated (EPS, P/E, rate) shocks from
+    its own seeded stream (see _simulate), so results are reproducible and
+    independent of `block_size` and `workers`. Rows are simulated in blocks
+    of about `block_size` path cells, and only the summary is kept: mean and
+    std of the return, the return and index level at each quantile, and VaR
+    and expected shortfall (losses, in %) at each level. Rows without a
+    current interest rate and bases with missing or non-positive EPS/PE are
+    skipped. `workers` > 1 shards the rows across processes.
+    """
+    if paths < 1 or block_size < 1:
+        raise ValueError(f"paths and block_size must be positive, got {paths} and {block_size}")
+    chol = _cholesky(correlation)
+    missing = [name for name in SHOCK_NAMES if name not in shocks]
+    if missing:
+        raise KeyError(f"Missing shock parameters: {missing}")
+
+    kwargs = dict(bases=bases, paths=paths, seed=seed, shocks=shocks, correlation=correlation, quantiles=quantiles,
+                  var_levels=var_levels, block_size=block_size, pass_through=pass_through, rate_floor=rate_floor)
+    if workers > 1 and len(df) > 1:
+        shards = shard_rows(df, workers)
+        stages = [Stage(f"monte_carlo[{i}]", monte_carlo_summary, (shard,), kwargs=kwargs) for i, shard in enumerate(shards)]
+        results = run_stages(stages, workers)
+        return pd.concat([results[stage.name] for stage in stages], ignore_index=True)
+
+    inputs = _Inputs(df, bases)
+    quantiles = np.asarray(quantiles, dtype=float)
+    var_levels = np.asarray(var_levels, dtype=float)
+    tail_q = 1 - var_levels
+
+    frames = []
+    # Without valid rows one empty batch still goes through, so the columns and dtypes match a non-empty summary
+    for rows in list(_batches(inputs, paths, block_size)) or [slice(0, 0)]:
+        returns = _simulate(inputs, rows, paths, seed, shocks, chol, pass_through, rate_floor)
+        stats = np.quantile(returns, np.concatenate([quantiles, tail_q]), axis=-1)   # (q, r, bases)
+        return_q, var_q = stats[:len(quantiles)], stats[len(quantiles):]
+        tail = returns <= var_q[..., None]
+        with np.errstate(invalid="ignore"):  # invalid bases are NaN and dropped below
+            shortfall = np.where(tail, returns, 0.0).sum(axis=-1) / tail.sum(axis=-1)
+
+        valid = inputs.valid[rows]
+        row_idx, basis_idx = np.nonzero(valid)
+        eps = inputs.eps[rows][row_idx, basis_idx]
+        pe = inputs.pe[rows][row_idx, basis_idx]
+        price = eps * pe
+        basis_labels = np.asarray(inputs.bases, dtype=object)[basis_idx]
+
+        columns = {
+            "Benchmark": inputs.benchmark[rows][row_idx],
+            "Date": inputs.date[rows][row_idx],
+            "EPS Type": basis_labels,
+            "PE Type": basis_labels,
+            "Paths": np.full(len(row_idx), paths),
+            "Current EPS": eps,
+            "Current PE": pe,
+            "Current Index Level": price,
+            "Current Interest Rate": inputs.rate[rows][row_idx],
+            "Mean Return (%)": returns.mean(axis=-1)[row_idx, basis_idx] * 100,
+            "Std Return (%)": returns.std(axis=-1)[row_idx, basis_idx] * 100,
+        }
+        for q, values in zip(quantiles, return_q):
+            columns[f"Return {_quantile_label(q)} (%)"] = values[row_idx, basis_idx] * 100
+        for q, values in zip(quantiles, return_q):
+            columns[f"Index Level {_quantile_label(q)}"] = price * (1 + values[row_idx, basis_idx])
+        for level, values, es in zip(var_levels, var_q, shortfall):
+            columns[f"VaR {level * 100:g}% (%)"] = -values[row_idx, basis_idx] * 100
+            columns[f"ES {level * 100:g}% (%)"] = -es[row_idx, basis_idx] * 100
+        frames.append(pd.DataFrame(columns))
+
+    summary = pd.concat(frames, ignore_index=True)
+    if summary.empty:
+        # No labels to infer the string dtype from; use what a non-empty summary gets
+        summary = summary.astype({c: str for c in ("Benchmark", "EPS Type", "PE Type")})
+    return summary
+
+
+def iter_monte_carlo_paths(
+    df: pd.DataFrame,
+    bases=VALUATION_BASES,
+    paths: int = MC_PATHS,
+    seed: int = MC_SEED,
+    shocks: dict = MC_SHOCKS,
+    correlation=MC_CORRELATION,
+    block_size: int = MC_BLOCK_SIZE,
+    pass_through: float = MC_RATE_PASS_THROUGH,
+    rate_floor: float = MC_RATE_FLOOR
+):
+    """
+    Raw simulated paths, one long DataFrame per block (Benchmark, Date, EPS
+    Type, Path, Implied Index Level, Implied Return (%)). Same draws as
+    monte_carlo_summary; meant for streaming to utils.io.write_chunks.
+    """
+    chol = _cholesky(correlation)
+    inputs = _Inputs(df, bases)
+    for rows in _batches(inputs, paths, block_size):
+        returns = _simulate(inputs, rows, paths, seed, shocks, chol, pass_through, rate_floor)
+        row_idx, basis_idx = np.nonzero(inputs.valid[rows])
+        price = inputs.eps[rows][row_idx, basis_idx] * inputs.pe[rows][row_idx, basis_idx]
+        returns = returns[row_idx, basis_idx]                              # (k, paths)
+        yield pd.DataFrame({
+            "Benchmark": np.repeat(inputs.benchmark[rows][row_idx], paths),
+            "Date": np.repeat(inputs.date[rows][row_idx], paths),
+            "EPS Type": np.repeat(np.asarray(inputs.bases, dtype=object)[basis_idx], paths),
+            "Path": np.tile(np.arange(paths), len(row_idx)),
+            "Implied Index Level": (price[:, None] * (1 + returns)).ravel(),
+            "Implied Return (%)": returns.ravel() * 100,
+        })
@@ -0,0 +1,168 @@
+# utils/pe_stats.py
+
+import numpy as np
+import pandas as pd
+
+from config import PE_STATS_PERIODS_PER_YEAR, PE_STATS_MIN_COVERAGE
+from utils.valuation_diagnostics import HORIZONS, PE_TYPES
+
+KEY_COLUMNS = ["benchmark_id", "date"]
+
+
+def stat_columns(pe_types=PE_TYPES, horizons=HORIZONS) -> list:
+    """
+    The `{pe_type}_{avg,std}_{h}y` columns compute_pe_z_scores reads, in input-file order.
+    """
+    return [f"{pe_type}_{stat}_{h}y" for pe_type in pe_types for h in horizons for stat in ("avg", "std")]
+
+
+def _prepare(history: pd.DataFrame, pe_types):
+    """
+    Key and P/E columns sorted by benchmark_id and date, plus integer benchmark codes
+    in the same order. Already sorted input (e.g. a saved tail) is not re-sorted.
+    """
+    missing = [c for c in KEY_COLUMNS + list(pe_types) if c not in history.columns]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+    history = history[KEY_COLUMNS + list(pe_types)].assign(date=lambda d: pd.to_datetime(d["date"]))
+
+    codes, _ = pd.factorize(history["benchmark_id"], sort=True)
+    dates = history["date"].to_numpy().view("i8")
+    same = codes[1:] == codes[:-1]
+    if not ((codes[1:] > codes[:-1]) | (same & (dates[1:] >= dates[:-1]))).all():
+        order = np.lexsort((dates, codes))
+        history, codes, dates = history.take(order), codes[order], dates[order]
+        same = codes[1:] == codes[:-1]
+    if (same & (dates[1:] == dates[:-1])).any():
+        raise ValueError("P/E history has duplicate (benchmark_id, date) rows")
+    return history.reset_index(drop=True), codes
+
+
+def _group_bounds(codes: np.ndarray):
+    # Start offset of each benchmark's run in the sorted rows, and each run's length
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+    return starts, np.diff(np.r_[starts, len(codes)])
+
+
+def _rolling_stats(history: pd.DataFrame, codes, pe_types, horizons, periods_per_year, min_coverage, emit=None) -> pd.DataFrame:
+    """
+    Trailing mean and sample std over the last h × periods_per_year observations
+    of each benchmark, for every P/E type and horizon, from one set of prefix
+    sums per type: each window is two lookups, so the cost is O(rows) whatever
+    the horizon. Values are shifted by each benchmark's first observation
+    before summing, which keeps the sum-of-squares variance numerically stable.
+    Windows with fewer than `min_coverage` of their observations present are
+    NaN. `emit` (a boolean mask over the sorted rows) limits the output rows.
+    """
+    n = len(history)
+    values = np.column_stack([pd.to_numeric(history[c]).to_numpy(dtype=float) for c in pe_types])
+    group_start, group_size = _group_bounds(codes)
+    starts = np.repeat(group_start, group_size)
+
+    present = ~np.isnan(values)
+    shift = np.full(values.shape, np.nan)
+    if n:
+        first = np.minimum.reduceat(np.where(present, np.arange(n)[:, None], n), group_start, axis=0)
+        padded = np.vstack([values, np.full((1, values.shape[1]), np.nan)])
+        shift = np.repeat(np.take_along_axis(padded, first, axis=0), group_size, axis=0)
+    centered = np.where(present, values - shift, 0.0)
+
+    def prefix(x):
+        return np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+
+    count_p, sum_p, sumsq_p = prefix(present.astype(float)), prefix(centered), prefix(centered ** 2)
+
+    rows = np.arange(n) if emit is None else np.flatnonzero(emit)
+    out = {"benchmark_id": history["benchmark_id"].iloc[rows].to_numpy(), "date": history["date"].iloc[rows].to_numpy()}
+    stats = {}
+    for h in horizons:
+        window = int(h) * periods_per_year
+        lo = np.maximum(starts[rows], rows - window + 1)
+        hi = rows + 1
+        count = count_p[hi] - count_p[lo]
+        total = sum_p[hi] - sum_p[lo]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / count
+            var = np.maximum((sumsq_p[hi] - sumsq_p[lo]) - total * mean, 0.0) / (count - 1)
+        enough = count >= max(2, min_coverage * window)
+        stats[h] = (np.where(enough, mean + shift[rows], np.nan), np.where(enough, np.sqrt(var), np.nan))
+
+    for i, pe_type in enumerate(pe_types):
+        for h in horizons:
+            out[f"{pe_type}_avg_{h}y"] = stats[h][0][:, i]
+            out[f"{pe_type}_std_{h}y"] = stats[h][1][:, i]
+    return pd.DataFrame(out)
+
+
+def _tail(history: pd.DataFrame, codes, horizons, periods_per_year) -> pd.DataFrame:
+    keep = max(int(h) for h in horizons) * periods_per_year - 1
+    group_start, group_size = _group_bounds(codes)
+    group_end = np.repeat(group_start + group_size, group_size)
+    return history[np.arange(len(history)) >= group_end - keep].reset_index(drop=True)
+
+
+def rolling_pe_stats(
+    history: pd.DataFrame,
+    pe_types=PE_TYPES,
+    horizons=HORIZONS,
+    periods_per_year: int = PE_STATS_PERIODS_PER_YEAR,
+    min_coverage: float = PE_STATS_MIN_COVERAGE
+) -> pd.DataFrame:
+    """
+    Build every `{pe_type}_{avg,std}_{h}y` column from a daily P/E history panel
+    (benchmark_id, date and one column per P/E type). The horizon-h window is
+    the benchmark's last h × `periods_per_year` observations up to and
+    including each date; std is the sample std, as in pandas rolling. Returns
+    one row per history row, sorted by benchmark_id and date.
+    """
+    history, codes = _prepare(history, pe_types)
+    return _rolling_stats(history, codes, pe_types, horizons, periods_per_year, min_coverage)
+
+
+def history_tail(
+    history: pd.DataFrame,
+    pe_types=PE_TYPES,
+    horizons=HORIZONS,
+    periods_per_year: int = PE_STATS_PERIODS_PER_YEAR
+) -> pd.DataFrame:
+    """
+    The observations per benchmark that the longest window still needs after
+    the last date: all the state append_pe_stats requires.
+    """
+    history, codes = _prepare(history, pe_types)
+    return _tail(history, codes, horizons, periods_per_year)
+
+
+def append_pe_stats(
+    tail: pd.DataFrame,
+    new_rows: pd.DataFrame,
+    pe_types=PE_TYPES,
+    horizons=HORIZONS,
+    periods_per_year: int = PE_STATS_PERIODS_PER_YEAR,
+    min_coverage: float = PE_STATS_MIN_COVERAGE
+):
+    """
+    Stats for `new_rows` (later dates than `tail` for each benchmark) from the
+    previous history_tail. Only the new rows' windows are evaluated, so the cost
+    scales with the tail, not the full history. Returns (stats, updated tail).
+    """
+    tail, tail_codes = _prepare(tail, pe_types)
+    new_rows, _ = _prepare(new_rows, pe_types)
+
+    group_start, group_size = _group_bounds(tail_codes)
+    group_end = group_start + group_size - 1
+    last = pd.Series(tail["date"].iloc[group_end].to_numpy(), index=tail["benchmark_id"].iloc[group_end].to_numpy())
+    stale = new_rows["date"] <= new_rows["benchmark_id"].map(last)
+    if stale.any():
+        raise ValueError(f"append_pe_stats only appends later dates; {int(stale.sum())} new rows are on or before "
+                         f"their benchmark's last date, e.g. {new_rows.loc[stale, KEY_COLUMNS].iloc[0].tolist()}")
+
+    combined, codes = _prepare(pd.concat([tail, new_rows], ignore_index=True), pe_types)
+    # Tail rows precede new rows within each benchmark, so a row is new past its benchmark's tail count
+    start, size = _group_bounds(codes)
+    tail_count = pd.Series(group_size, index=tail["benchmark_id"].iloc[group_start].to_numpy())
+    tail_count = tail_count.reindex(combined["benchmark_id"].iloc[start].to_numpy(), fill_value=0).to_numpy()
+    is_new = np.arange(len(combined)) - np.repeat(start, size) >= np.repeat(tail_count, size)
+
+    stats = _rolling_stats(combined, codes, pe_types, horizons, periods_per_year, min_coverage, emit=is_new)
+    return stats, _tail(combined, codes, horizons, periods_per_year)
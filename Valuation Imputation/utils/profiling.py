@@ -0,0 +1,234 @@
+# utils/profiling.py
+
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+import functools
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+REPORT_COLUMNS = ["stage", "parent", "pid", "wall_s", "cpu_s", "rows_in", "rows_out", "peak_mb", "max_rss_mb", "profile"]
+
+_ACTIVE = None  # StageRecorder collecting records in this process, if any
+
+
+def count_rows(obj, ints=False):
+    """
+    Rows in a DataFrame/Series, or summed over a tuple/list of them. With
+    `ints=True` a plain integer counts as a row count too (the streaming
+    stages return the number of rows they wrote). None when nothing counts.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if ints and isinstance(obj, (int, np.integer)) and not isinstance(obj, bool):
+        return int(obj)
+    if isinstance(obj, (tuple, list)):
+        counts = [c for c in (count_rows(o, ints) for o in obj) if c is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def _max_rss_mb():
+    # Process high-water mark; ru_maxrss is in KB on Linux and bytes on macOS
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+class StageRecorder:
+    """
+    Collects one record per pipeline stage: wall and CPU seconds, rows in/out,
+    the process's max RSS after the stage and, with `trace_memory=True`, the
+    peak Python/NumPy allocation during the stage (tracemalloc, which slows
+    allocation-heavy code, so it is opt-in). Stages nest: writes and merges
+    inside a stage are recorded with that stage as `parent`, and a stage that
+    returns no rows reports the rows its writes produced.
+
+    Stages named in `profile` (exact name, or the part before "[", so
+    "basis" covers every basis[...] stage) also run under cProfile; the
+    stats are dumped to `profile_dir/<stage>.prof`.
+    """
+
+    def __init__(self, trace_memory=False, profile=(), profile_dir=Path("profiles")):
+        self.trace_memory = trace_memory
+        self.profile = set(profile)
+        self.profile_dir = Path(profile_dir)
+        self.records = []
+        self._stack = []
+        self._profiling = False
+
+    def options(self) -> dict:
+        # Picklable settings for recorders created in worker processes
+        return {"trace_memory": self.trace_memory, "profile": sorted(self.profile), "profile_dir": self.profile_dir}
+
+    def _wants_profile(self, name):
+        return not self._profiling and (name in self.profile or name.split("[")[0] in self.profile)
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Time the enclosed block as stage `name`. Yields the record dict so the
+        caller can fill in `rows_out`.
+        """
+        parent = self._stack[-1] if self._stack else None
+        record = {"stage": name, "parent": parent["record"]["stage"] if parent else None, "pid": os.getpid(),
+                  "rows_in": rows_in, "rows_out": None, "peak_mb": None, "profile": None}
+        frame = {"record": record, "written": 0}
+
+        own_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent["peak"] = max(parent["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start"] = frame["peak"] = current
+
+        profiler = None
+        if self._wants_profile(name):
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+
+        self._stack.append(frame)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - start_wall
+            record["cpu_s"] = time.process_time() - start_cpu
+            self._stack.pop()
+
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                path = self.profile_dir / f"{name}.prof"
+                profiler.dump_stats(path)
+                record["profile"] = str(path)
+
+            if self.trace_memory:
+                frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                record["peak_mb"] = (frame["peak"] - frame["start"]) / 2**20
+                if parent is not None:
+                    parent["peak"] = max(parent["peak"], frame["peak"])
+            if own_tracing:
+                tracemalloc.stop()
+            record["max_rss_mb"] = _max_rss_mb()
+
+            if record["rows_out"] is None and frame["written"]:
+                record["rows_out"] = frame["written"]
+            if parent is not None and record["stage"].startswith(("write[", "merge[")):
+                parent["written"] += record["rows_out"] or 0
+
+            self.records.append(record)
+            if parent is None:
+                logging.info(
+                    f"Stage {name}: {record['wall_s']:.3f}s wall, {record['cpu_s']:.3f}s CPU, "
+                    f"rows {record['rows_in'] if record['rows_in'] is not None else '-'} → "
+                    f"{record['rows_out'] if record['rows_out'] is not None else '-'}"
+                )
+
+    def report(self) -> pd.DataFrame:
+        report = pd.DataFrame(self.records, columns=REPORT_COLUMNS)
+        return report.astype({"rows_in": "Int64", "rows_out": "Int64"})
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Top-level stages aggregated by name (a chunked run records each stage
+        once per chunk), slowest first.
+        """
+        top = self.report()
+        top = top[top["parent"].isna()]
+        return (
+            top.groupby("stage", sort=False)
+            .agg(calls=("stage", "size"), wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"),
+                 rows_in=("rows_in", lambda rows: rows.sum(min_count=1)),
+                 rows_out=("rows_out", lambda rows: rows.sum(min_count=1)),
+                 peak_mb=("peak_mb", "max"), max_rss_mb=("max_rss_mb", "max"))
+            .sort_values("wall_s", ascending=False)
+        )
+
+    def save(self, path, **metadata):
+        """
+        Write the run report. A `.csv` path gets one row per stage record;
+        anything else is written as JSON with `metadata` alongside the records.
+        """
+        path = Path(path)
+        report = self.report()
+        if path.suffix.lower() == ".csv":
+            report.to_csv(path, index=False)
+        else:
+            records = json.loads(report.to_json(orient="records"))
+            path.write_text(json.dumps({**metadata, "stages": records}, indent=2, default=str))
+        return path
+
+
+@contextmanager
+def activate(recorder):
+    """
+    Make `recorder` the target of record_stage() and @recorded in this process.
+    """
+    global _ACTIVE
+    previous, _ACTIVE = _ACTIVE, recorder
+    try:
+        yield recorder
+    finally:
+        _ACTIVE = previous
+
+
+@contextmanager
+def record_stage(name, rows_in=None):
+    """
+    recorder.stage() on the active recorder; a no-op when none is active.
+    """
+    if _ACTIVE is None:
+        yield {}
+        return
+    with _ACTIVE.stage(name, rows_in) as record:
+        yield record
+
+
+def recorded(label):
+    """
+    Record each call of a `func(df, name, ...)` writer as the stage
+    `{label}[{name}]` when a recorder is active.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(df, name, *args, **kwargs):
+            if _ACTIVE is None:
+                return func(df, name, *args, **kwargs)
+            with _ACTIVE.stage(f"{label}[{name}]", rows_in=len(df)) as record:
+                result = func(df, name, *args, **kwargs)
+                record["rows_out"] = len(df)
+            return result
+        return wrapper
+    return decorate
+
+
+def run_stage(name, func, args, kwargs, options):
+    """
+    Call func(*args, **kwargs) as a recorded stage under a fresh recorder built
+    from `options`. Returns (result, records) so a worker process can ship its
+    records back to the parent.
+    """
+    recorder = StageRecorder(**options)
+    with activate(recorder), recorder.stage(name, rows_in=count_rows(list(args))) as record:
+        result = func(*args, **kwargs)
+        record["rows_out"] = count_rows(result, ints=True)
+    return result, recorder.records
@@ -1,24 +1,29 @@
 import pandas as pd
 import numpy as np
+from utils.cache import cached_scenario
+from utils.grids import GRIDS, to_percent
 
-def generate_pe_scenario_tables(base_pe, change_range=np.linspace(-0.2, 0.2, 9)):
-    pct_labels = [f"{int(c*100)}%" for c in change_range]
+@cached_scenario
+def generate_pe_scenario_tables(base_pe, change_range=GRIDS["pe_table"].values):
+    pct_labels = [f"{round(c*100)}%" for c in change_range]
     abs_vals = [base_pe * (1 + c) for c in change_range]
     df_pct = pd.DataFrame({"PE Change (%)": pct_labels, "PE Value": abs_vals})
     df_abs = pd.DataFrame({"PE Value": abs_vals}, index=pct_labels)
     return df_pct, df_abs
 
-def generate_eps_scenario_tables(base_eps, change_range=np.linspace(-0.2, 0.2, 9)):
+@cached_scenario
+def generate_eps_scenario_tables(base_eps, change_range=GRIDS["eps_table"].values):
     data = []
     for c in change_range:
         eps_val = base_eps * (1 + c)
         flag = "Current" if np.isclose(c, 0.0) else "What-if"
-        data.append({"EPS Change (%)": f"{int(c*100)}%", "EPS Value": eps_val, "Scenario": flag})
+        data.append({"EPS Change (%)": f"{round(c*100)}%", "EPS Value": eps_val, "Scenario": flag})
     return pd.DataFrame(data)
 
+@cached_scenario
 def generate_combined_long_format(base_eps, base_pe,
-                                  eps_changes=np.linspace(-0.2, 0.2, 5),
-                                  pe_changes=np.linspace(-0.2, 0.2, 5)):
+                                  eps_changes=GRIDS["combined_eps"].values,
+                                  pe_changes=GRIDS["combined_pe"].values):
     base_price = base_eps * base_pe
     scenarios = []
     for e in eps_changes:
@@ -29,8 +34,8 @@ def generate_combined_long_format(base_eps, base_pe,
             ret = (price / base_price) - 1
             flag = "Current" if (np.isclose(e, 0.0) and np.isclose(p, 0.0)) else "What-if"
             scenarios.append({
-                "EPS Change (%)": f"{int(e*100)}%",
-                "PE Change (%)": f"{int(p*100)}%",
+                "EPS Change (%)": f"{round(e*100)}%",
+                "PE Change (%)": f"{round(p*100)}%",
                 "EPS Value": eps,
                 "PE Value": pe,
                 "Implied Price": price,
@@ -39,118 +44,256 @@ def generate_combined_long_format(base_eps, base_pe,
             })
     return pd.DataFrame(scenarios)
 
-def generate_cross_basis_scenarios(row: pd.Series) -> list[dict]:
+VALUATION_BASES = ["trailing", "fwd_1y", "fwd_2y"]
+CROSS_BASIS_EPS_RANGE = GRIDS["cross_basis_eps"].values   # -50% to +50% by default
+CROSS_BASIS_PE_RANGE = GRIDS["cross_basis_pe"].values     # -50% to +50% by default
+RATE_CHANGE_RANGE_BPS = GRIDS["rate_bps"].values          # -200 to +200 bps in 25 bps steps by default
+
+
+def _resolve_column(df: pd.DataFrame, *names: str) -> str | None:
     """
-    Generate combined EPS × PE scenarios for a single benchmark row.
-    Includes original EPS, PE, Index, and type metadata for each basis.
+    Return the first of `names` present in `df` (raw name first, display name second).
     """
-    benchmark = row.get("benchmark_id") or row.get("Benchmark")
-    scenarios = []
+    for name in names:
+        if name in df.columns:
+            return name
+    return None
+
+
+def _expand(values: np.ndarray, axes: tuple, shape: tuple) -> np.ndarray:
+    """
+    Broadcast an array laid out over `axes` of a scenario grid of `shape` and flatten it.
+    """
+    index = tuple(slice(None) if axis in axes else None for axis in range(len(shape)))
+    return np.broadcast_to(values[index], shape).ravel()
+
+
+def cross_basis_scenarios(
+    df: pd.DataFrame,
+    bases=VALUATION_BASES,
+    eps_grid=CROSS_BASIS_EPS_RANGE,
+    pe_grid=CROSS_BASIS_PE_RANGE,
+    rate_grid=None
+) -> pd.DataFrame:
+    """
+    Frame-in/frame-out EPS × PE (× Interest Rate) scenarios for every benchmark in `df`.
+
+    Required columns are validated once up front, then the whole grid for all
+    benchmarks and bases is built as column arrays in a single broadcast pass.
+    Grids are fractions (or GridSpecs, see utils/grids.py) and default to the
+    config grids. Pass `rate_grid` (bps) to add the interest-rate dimension; rows without a
+    current interest rate are then skipped. Bases with missing or non-positive
+    EPS/PE are skipped. Rows are ordered benchmark → basis → eps → pe (→ rate).
+    """
+    with_rates = rate_grid is not None
 
-    for basis in ["trailing", "fwd_1y", "fwd_2y"]:
-        eps_key = f"eps_{basis}"
-        pe_key = f"pe_{basis}"
+    benchmark_col = _resolve_column(df, "benchmark_id", "Benchmark")
+    rate_col = _resolve_column(df, "current_interest_rate", "Current Interest Rate")
+    missing = [c for b in bases for c in (f"eps_{b}", f"pe_{b}") if c not in df.columns]
+    if benchmark_col is None:
+        missing.insert(0, "benchmark_id")
+    if with_rates and rate_col is None:
+        missing.append("current_interest_rate")
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
 
-        eps = row.get(eps_key)
-        pe = row.get(pe_key)
+    eps_grid = np.asarray(eps_grid)
+    pe_grid = np.asarray(pe_grid)
 
-        if pd.isna(eps) or pd.isna(pe) or eps <= 0 or pe <= 0:
-            continue
+    benchmark = df[benchmark_col].to_numpy(dtype=object)
+    eps = np.column_stack([pd.to_numeric(df[f"eps_{b}"]).to_numpy(dtype=float) for b in bases])
+    pe = np.column_stack([pd.to_numeric(df[f"pe_{b}"]).to_numpy(dtype=float) for b in bases])
 
-        base_price = eps * pe
-        eps_change_range = np.arange(-0.5, 0.55, 0.1)   # -50% to +50%
-        pe_change_range = np.arange(-0.5, 0.55, 0.1)
+    # np.nonzero walks the mask row-major, so output stays ordered benchmark → basis.
+    with np.errstate(invalid="ignore"):
+        valid = (eps > 0) & (pe > 0)
+    if with_rates:
+        current_rate = pd.to_numeric(df[rate_col]).to_numpy(dtype=float)
+        valid &= ~np.isnan(current_rate)[:, None]
+    row_idx, basis_idx = np.nonzero(valid)
 
-        for eps_chg in eps_change_range:
-            for pe_chg in pe_change_range:
-                adj_eps = eps * (1 + eps_chg)
-                adj_pe = pe * (1 + pe_chg)
-                implied_price = adj_eps * adj_pe
-                implied_return = (implied_price / base_price) - 1 if base_price else None
+    eps_v = eps[row_idx, basis_idx]
+    pe_v = pe[row_idx, basis_idx]
+    base_price = eps_v * pe_v
 
-                scenarios.append({
-                    "Benchmark": benchmark,
-                    "EPS Type": basis,
-                    "PE Type": basis,
-                    "EPS Change (%)": eps_chg * 100,
-                    "PE Change (%)": pe_chg * 100,
-                    "Adjusted EPS": adj_eps,
-                    "Adjusted PE": adj_pe,
-                    "Implied Index Level": implied_price,
-                    "Implied Return (%)": implied_return * 100 if implied_return is not None else None,
+    adj_eps = eps_v[:, None] * (1 + eps_grid)                            # (k, eps)
+    adj_pe = pe_v[:, None] * (1 + pe_grid)                               # (k, pe)
+    implied_price = adj_eps[:, :, None] * adj_pe[:, None, :]             # (k, eps, pe)
+    implied_return = (implied_price / base_price[:, None, None]) - 1
 
-                    # Actual Current Levels
-                    "Current EPS": eps,
-                    "Current PE": pe,
-                    "Current Index Level": base_price
-                })
+    shape = (len(eps_v), len(eps_grid), len(pe_grid))
+    if with_rates:
+        rate_grid = np.asarray(rate_grid)
+        shape += (len(rate_grid),)
 
-    return scenarios
+    def expand(values, axes):
+        return _expand(values, axes, shape)
+
+    basis_labels = np.asarray(bases, dtype=object)[basis_idx]
+
+    columns = {
+        "Benchmark": expand(benchmark[row_idx], (0,)),
+        "EPS Type": expand(basis_labels, (0,)),
+        "PE Type": expand(basis_labels, (0,)),
+
+        # Scenario deltas
+        "EPS Change (%)": expand(to_percent(eps_grid), (1,)),
+        "PE Change (%)": expand(to_percent(pe_grid), (2,)),
+    }
+    if with_rates:
+        rate_v = current_rate[row_idx]
+        columns["Interest Rate Change (bps)"] = expand(rate_grid, (3,))
+
+    # Adjusted values
+    columns["Adjusted EPS"] = expand(adj_eps, (0, 1))
+    columns["Adjusted PE"] = expand(adj_pe, (0, 2))
+    if with_rates:
+        columns["Adjusted Interest Rate"] = expand(rate_v[:, None] + rate_grid / 100.0, (0, 3))  # bps → %
+    columns["Implied Index Level"] = expand(implied_price, (0, 1, 2))
+    columns["Implied Return (%)"] = expand(implied_return * 100, (0, 1, 2))
+
+    # Current baseline values
+    columns["Current EPS"] = expand(eps_v, (0,))
+    columns["Current PE"] = expand(pe_v, (0,))
+    columns["Current Index Level"] = expand(base_price, (0,))
+    if with_rates:
+        columns["Current Interest Rate"] = expand(rate_v, (0,))
+
+    return pd.DataFrame(columns)
+
+
+def generate_cross_basis_scenarios(row: pd.Series) -> list[dict]:
+    """
+    Generate combined EPS × PE scenarios for a single benchmark row.
+    Includes original EPS, PE, Index, and type metadata for each basis.
+    Thin wrapper over cross_basis_scenarios; prefer the batch API for whole frames.
+    """
+    return cross_basis_scenarios(row.to_frame().T).to_dict("records")
 
 
 def generate_cross_basis_scenarios_with_rates(row: pd.Series) -> list[dict]:
     """
     Generate combined EPS × PE × Interest Rate scenarios for a single benchmark row.
     Includes metadata like type, current EPS/PE/Price, and interest rate.
+    Thin wrapper over cross_basis_scenarios; prefer the batch API for whole frames.
     """
-    benchmark = row.get("benchmark_id") or row.get("Benchmark")
-    current_rate = row.get("current_interest_rate") or row.get("Current Interest Rate") # Make sure this field is in your data
-    print(current_rate)
-    if pd.isna(current_rate):
-        return []  # Skip if no current interest rate
+    return cross_basis_scenarios(row.to_frame().T, rate_grid=RATE_CHANGE_RANGE_BPS).to_dict("records")
 
-    scenarios = []
 
-    # Iterate over each valuation basis
-    for basis in ["trailing", "fwd_1y", "fwd_2y"]:
-        eps_key = f"eps_{basis}"
-        pe_key = f"pe_{basis}"
-
-        eps = row.get(eps_key)
-        pe = row.get(pe_key)
-        print(eps,pe)
-        if pd.isna(eps) or pd.isna(pe) or eps <= 0 or pe <= 0:
-            continue
-
-        base_price = eps * pe
-
-        # EPS and PE changes
-        eps_change_range = np.arange(-0.5, 0.55, 0.1)   # -50% to +50%
-        pe_change_range = np.arange(-0.5, 0.55, 0.1)
-
-        # Interest rate changes in basis points
-        rate_change_range = np.arange(-200, 225, 25)  # -200 to +200 bps in 25 bps steps
-
-        for eps_chg in eps_change_range:
-            for pe_chg in pe_change_range:
-                for rate_chg in rate_change_range:
-                    adj_eps = eps * (1 + eps_chg)
-                    adj_pe = pe * (1 + pe_chg)
-                    implied_price = adj_eps * adj_pe
-                    implied_return = (implied_price / base_price) - 1 if base_price else None
-
-                    scenarios.append({
-                        "Benchmark": benchmark,
-                        "EPS Type": basis,
-                        "PE Type": basis,
-
-                        # Scenario deltas
-                        "EPS Change (%)": eps_chg * 100,
-                        "PE Change (%)": pe_chg * 100,
-                        "Interest Rate Change (bps)": rate_chg,
-
-                        # Adjusted values
-                        "Adjusted EPS": adj_eps,
-                        "Adjusted PE": adj_pe,
-                        "Adjusted Interest Rate": current_rate + rate_chg / 100.0,  # convert bps to %
-                        "Implied Index Level": implied_price,
-                        "Implied Return (%)": implied_return * 100 if implied_return is not None else None,
-
-                        # Current baseline values
-                        "Current EPS": eps,
-                        "Current PE": pe,
-                        "Current Index Level": base_price,
-                        "Current Interest Rate": current_rate
-                    })
-
-    return scenarios
+def iter_cross_basis_scenarios(df: pd.DataFrame, chunk_size: int = 500, **grid_kwargs):
+    """
+    Stream cross_basis_scenarios in fixed-size benchmark batches.
+    Yields one scenario DataFrame per `chunk_size` input rows, so memory stays
+    bounded by the batch size rather than the full universe. `grid_kwargs`
+    (bases, eps_grid, pe_grid, rate_grid) are passed through unchanged.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+    for start in range(0, len(df), chunk_size):
+        yield cross_basis_scenarios(df.iloc[start:start + chunk_size], **grid_kwargs)
+
+
+def _base_values(df: pd.DataFrame, basis: str, kinds: tuple):
+    """
+    Benchmark and date keys plus the `kinds` (eps/pe) base values of `basis`,
+    for the rows where all of them are present.
+    """
+    benchmark_col = _resolve_column(df, "benchmark_id", "Benchmark")
+    date_col = _resolve_column(df, "date", "Date")
+    missing = [f"{kind}_{basis}" for kind in kinds if f"{kind}_{basis}" not in df.columns]
+    if date_col is None:
+        missing.insert(0, "date")
+    if benchmark_col is None:
+        missing.insert(0, "benchmark_id")
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+
+    values = [pd.to_numeric(df[f"{kind}_{basis}"]).to_numpy(dtype=float) for kind in kinds]
+    keep = ~np.logical_or.reduce([np.isnan(v) for v in values])
+    keys = (df[benchmark_col].to_numpy(dtype=object)[keep], df[date_col].to_numpy()[keep])
+    return keys, [v[keep] for v in values]
+
+
+def _pct_labels(grid: np.ndarray) -> np.ndarray:
+    # Same "-20%" labels as the single-row tables, built once per grid
+    return np.array([f"{round(c*100)}%" for c in grid], dtype=object)
+
+
+def pe_scenario_tables(df: pd.DataFrame, basis: str, change_range=GRIDS["pe_table"]):
+    """
+    generate_pe_scenario_tables for every row of `df` in one pass.
+
+    Returns the long table (Benchmark, Date, PE Change (%), PE Value), ordered
+    row → change, and the wide table with one column per change label. Rows
+    without a `pe_<basis>` value are skipped.
+    """
+    (benchmark, date), (pe,) = _base_values(df, basis, ("pe",))
+    grid = np.asarray(change_range)
+    labels = _pct_labels(grid)
+    values = pe[:, None] * (1 + grid)                                    # (n, change)
+    shape = values.shape
+
+    df_pct = pd.DataFrame({
+        "Benchmark": _expand(benchmark, (0,), shape),
+        "Date": _expand(date, (0,), shape),
+        "PE Change (%)": _expand(labels, (1,), shape),
+        "PE Value": values.ravel(),
+    })
+    df_abs = pd.DataFrame({"Benchmark": benchmark, "Date": date, **dict(zip(labels, values.T))})
+    return df_pct, df_abs
+
+
+def eps_scenario_tables(df: pd.DataFrame, basis: str, change_range=GRIDS["eps_table"]) -> pd.DataFrame:
+    """
+    generate_eps_scenario_tables for every row of `df` in one pass, with
+    Benchmark and Date keys. Rows without an `eps_<basis>` value are skipped.
+    """
+    (benchmark, date), (eps,) = _base_values(df, basis, ("eps",))
+    grid = np.asarray(change_range)
+    values = eps[:, None] * (1 + grid)                                   # (n, change)
+    shape = values.shape
+
+    return pd.DataFrame({
+        "Benchmark": _expand(benchmark, (0,), shape),
+        "Date": _expand(date, (0,), shape),
+        "EPS Change (%)": _expand(_pct_labels(grid), (1,), shape),
+        "EPS Value": values.ravel(),
+        "Scenario": _expand(np.where(np.isclose(grid, 0.0), "Current", "What-if").astype(object), (1,), shape),
+    })
+
+
+def combined_long_format(
+    df: pd.DataFrame,
+    basis: str,
+    eps_changes=GRIDS["combined_eps"],
+    pe_changes=GRIDS["combined_pe"]
+) -> pd.DataFrame:
+    """
+    generate_combined_long_format for every row of `df` in one broadcast pass,
+    with Benchmark and Date keys. Rows are ordered row → eps → pe; rows without
+    both `eps_<basis>` and `pe_<basis>` are skipped.
+    """
+    (benchmark, date), (eps, pe) = _base_values(df, basis, ("eps", "pe"))
+    eps_grid = np.asarray(eps_changes)
+    pe_grid = np.asarray(pe_changes)
+
+    base_price = eps * pe
+    adj_eps = eps[:, None] * (1 + eps_grid)                              # (n, eps)
+    adj_pe = pe[:, None] * (1 + pe_grid)                                 # (n, pe)
+    price = adj_eps[:, :, None] * adj_pe[:, None, :]                     # (n, eps, pe)
+    ret = (price / base_price[:, None, None]) - 1
+    shape = price.shape
+
+    current = np.isclose(eps_grid, 0.0)[:, None] & np.isclose(pe_grid, 0.0)[None, :]
+    return pd.DataFrame({
+        "Benchmark": _expand(benchmark, (0,), shape),
+        "Date": _expand(date, (0,), shape),
+        "EPS Change (%)": _expand(_pct_labels(eps_grid), (1,), shape),
+        "PE Change (%)": _expand(_pct_labels(pe_grid), (2,), shape),
+        "EPS Value": _expand(adj_eps, (0, 1), shape),
+        "PE Value": _expand(adj_pe, (0, 2), shape),
+        "Implied Price": price.ravel(),
+        "Implied Return": ret.ravel(),
+        "Scenario": _expand(np.where(current, "Current", "What-if").astype(object), (1, 2), shape),
+    })
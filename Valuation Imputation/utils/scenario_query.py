@@ -0,0 +1,198 @@
+# utils/scenario_query.py
+
+import numpy as np
+import pandas as pd
+
+from utils.scenario_analysis import (
+    cross_basis_scenarios,
+    _resolve_column,
+    VALUATION_BASES,
+    CROSS_BASIS_EPS_RANGE,
+    CROSS_BASIS_PE_RANGE,
+    RATE_CHANGE_RANGE_BPS
+)
+from utils.grids import to_percent
+
+
+class LazyScenarios:
+    """
+    On-demand view of the cross-basis EPS × PE × Interest Rate scenario grid.
+
+    Holds only the base values (benchmark, EPS/PE per basis, current rate) and
+    the grids; nothing is computed until `.to_frame()`. Selections narrow the
+    view without evaluating it:
+
+        scenarios = LazyScenarios(df)
+        scenarios.sel(benchmark="S&P 500", pe_pct=-20, rate_bps=50).to_frame()
+        scenarios[0, :, 5].to_frame()        # positional: benchmark row 0, every basis, 6th EPS step
+
+    Dimensions are benchmark (one entry per input row), basis, eps_pct, pe_pct
+    and, with a rate grid, rate_bps. `.to_frame()` evaluates the selection
+    with cross_basis_scenarios, so its rows and values are exactly the
+    matching rows of the fully materialized table. Pass `rate_grid=None` for
+    the EPS × PE grid without rates.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        bases=VALUATION_BASES,
+        eps_grid=CROSS_BASIS_EPS_RANGE,
+        pe_grid=CROSS_BASIS_PE_RANGE,
+        rate_grid=RATE_CHANGE_RANGE_BPS
+    ):
+        benchmark_col = _resolve_column(df, "benchmark_id", "Benchmark")
+        rate_col = _resolve_column(df, "current_interest_rate", "Current Interest Rate")
+        missing = [c for b in bases for c in (f"eps_{b}", f"pe_{b}") if c not in df.columns]
+        if benchmark_col is None:
+            missing.insert(0, "benchmark_id")
+        if rate_grid is not None and rate_col is None:
+            missing.append("current_interest_rate")
+        if missing:
+            raise KeyError(f"Missing required columns: {missing}")
+
+        # Base values only: one row per input row, projected onto the grid inputs
+        columns = [benchmark_col] + [f"{kind}_{b}" for b in bases for kind in ("eps", "pe")]
+        if rate_grid is not None:
+            columns.append(rate_col)
+        self._base = df[columns].reset_index(drop=True)
+        self._bases = list(bases)
+        self._grids = {
+            "eps_pct": np.asarray(eps_grid),
+            "pe_pct": np.asarray(pe_grid),
+        }
+        if rate_grid is not None:
+            self._grids["rate_bps"] = np.asarray(rate_grid)
+        self._benchmark_col = benchmark_col
+        self._rate_col = rate_col
+        self._index = {dim: np.arange(size) for dim, size in zip(self.dims, self._full_shape())}
+
+    def _full_shape(self):
+        return (len(self._base), len(self._bases)) + tuple(len(g) for g in self._grids.values())
+
+    def _view(self, index):
+        view = object.__new__(LazyScenarios)
+        view.__dict__.update(self.__dict__)
+        view._index = index
+        return view
+
+    @property
+    def dims(self) -> tuple:
+        return ("benchmark", "basis") + tuple(self._grids)
+
+    @property
+    def coords(self) -> dict:
+        """
+        Coordinate labels of the current selection, per dimension. Grid
+        coordinates are in the units of the output columns (%, bps).
+        """
+        coords = {
+            "benchmark": self._base[self._benchmark_col].to_numpy(dtype=object)[self._index["benchmark"]],
+            "basis": np.asarray(self._bases, dtype=object)[self._index["basis"]],
+        }
+        for dim, grid in self._grids.items():
+            values = to_percent(grid) if dim != "rate_bps" else grid
+            coords[dim] = values[self._index[dim]]
+        return coords
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(self._index[dim]) for dim in self.dims)
+
+    def _valid_pairs(self):
+        # (benchmark row, basis) cells that produce scenarios, as in cross_basis_scenarios
+        rows = self._base.iloc[self._index["benchmark"]]
+        bases = [self._bases[i] for i in self._index["basis"]]
+        eps = np.column_stack([pd.to_numeric(rows[f"eps_{b}"]).to_numpy(dtype=float) for b in bases])
+        pe = np.column_stack([pd.to_numeric(rows[f"pe_{b}"]).to_numpy(dtype=float) for b in bases])
+        with np.errstate(invalid="ignore"):
+            valid = (eps > 0) & (pe > 0)
+        if "rate_bps" in self._grids:
+            valid &= ~np.isnan(pd.to_numeric(rows[self._rate_col]).to_numpy(dtype=float))[:, None]
+        return valid
+
+    def __len__(self):
+        # Rows .to_frame() would return, without evaluating the grid
+        if 0 in self.shape:
+            return 0
+        return int(self._valid_pairs().sum()) * int(np.prod(self.shape[2:]))
+
+    def __repr__(self):
+        dims = ", ".join(f"{dim}: {size}" for dim, size in zip(self.dims, self.shape))
+        return f"LazyScenarios({dims}; {len(self):,} scenarios)"
+
+    def isel(self, **indexers) -> "LazyScenarios":
+        """
+        Select by position along the named dimensions. Each indexer is an int,
+        a slice or a list of positions within the current selection.
+        """
+        index = dict(self._index)
+        for dim, indexer in indexers.items():
+            if dim not in index:
+                raise ValueError(f"Unknown dimension {dim!r}; expected one of {list(self.dims)}")
+            if isinstance(indexer, (int, np.integer)):
+                indexer = [indexer]
+            index[dim] = index[dim][indexer]
+        return self._view(index)
+
+    def __getitem__(self, key) -> "LazyScenarios":
+        # Positional indexing in dimension order, e.g. scenarios[0, :, 5]
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > len(self.dims):
+            raise IndexError(f"Too many indexers: {len(key)} for {len(self.dims)} dimensions")
+        return self.isel(**dict(zip(self.dims, key)))
+
+    def sel(self, **labels) -> "LazyScenarios":
+        """
+        Select by label: benchmark and basis by name, eps_pct/pe_pct (%) and
+        rate_bps by grid value. Each label is a scalar, a list, or for the grid
+        dimensions an inclusive slice such as rate_bps=slice(0, 100). Grid values
+        match within floating-point tolerance.
+        """
+        coords = self.coords
+        indexers = {}
+        for dim, label in labels.items():
+            if dim not in coords:
+                raise ValueError(f"Unknown dimension {dim!r}; expected one of {list(self.dims)}")
+            values = coords[dim]
+
+            if isinstance(label, slice):
+                if dim in ("benchmark", "basis"):
+                    raise ValueError(f"Slices are only supported on grid dimensions, not {dim!r}")
+                lower = -np.inf if label.start is None else label.start - 1e-9
+                upper = np.inf if label.stop is None else label.stop + 1e-9
+                indexers[dim] = np.flatnonzero((values >= lower) & (values <= upper))
+                continue
+
+            wanted = label if isinstance(label, (list, tuple, np.ndarray, pd.Index)) else [label]
+            if dim in ("benchmark", "basis"):
+                hits = [np.flatnonzero(values == w) for w in wanted]
+            else:
+                hits = [np.flatnonzero(np.isclose(values.astype(float), w, rtol=0, atol=1e-9)) for w in wanted]
+            not_found = [w for w, h in zip(wanted, hits) if not len(h)]
+            if not_found:
+                raise KeyError(f"{dim} labels not found: {not_found}")
+            indexers[dim] = np.concatenate(hits) if hits else np.array([], dtype=np.intp)
+        return self.isel(**indexers)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Evaluate the current selection into the cross_basis_scenarios layout.
+        """
+        if 0 in self.shape:
+            # Empty selection: evaluate no rows over every basis and the full grids to get the empty layout
+            index = {dim: np.arange(size) for dim, size in zip(self.dims, self._full_shape())}
+            index["benchmark"] = index["benchmark"][:0]
+            return self._view(index)._evaluate()
+        return self._evaluate()
+
+    def _evaluate(self):
+        rows = self._base.iloc[self._index["benchmark"]]
+        return cross_basis_scenarios(
+            rows,
+            bases=[self._bases[i] for i in self._index["basis"]],
+            eps_grid=self._grids["eps_pct"][self._index["eps_pct"]],
+            pe_grid=self._grids["pe_pct"][self._index["pe_pct"]],
+            rate_grid=self._grids["rate_bps"][self._index["rate_bps"]] if "rate_bps" in self._grids else None
+        )
@@ -0,0 +1,215 @@
+# utils/star_schema.py
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import SENSITIVITY_BASES
+from utils.aliases import get_field_mapping
+from utils.grids import GRIDS, to_percent
+from utils.scenario_analysis import VALUATION_BASES, CROSS_BASIS_EPS_RANGE, CROSS_BASIS_PE_RANGE, RATE_CHANGE_RANGE_BPS
+from utils.transform import _sensitivity_grid
+from utils.valuation_diagnostics import _stat_cube, HORIZONS, PE_TYPES
+
+# Dimension and fact tables written by the star-schema export, in write order
+TABLES = [
+    "dim_benchmark", "dim_date", "dim_basis", "dim_metric", "dim_scenario", "dim_rate_shock",
+    "fact_baseline", "fact_metrics", "fact_cross_basis", "fact_pe_sensitivity",
+]
+
+METRIC_PATTERN = re.compile(
+    rf"^(?P<measure>pe|eps)_(?P<basis>{'|'.join(VALUATION_BASES)})(?:_(?P<stat>avg|std|z)_(?P<horizon>\d+)y)?$"
+)
+
+
+def parse_metric(name: str):
+    """
+    (measure, basis, stat, horizon in years) for an input metric column such as
+    `pe_trailing_avg_5y` → ("pe", "trailing", "avg", 5) or `eps_fwd_1y` →
+    ("eps", "fwd_1y", "value", None); None for columns that are not metrics.
+    """
+    if name == "current_interest_rate":
+        return "rate", None, "value", None
+    match = METRIC_PATTERN.match(name)
+    if match is None:
+        return None
+    horizon = match["horizon"]
+    return match["measure"], match["basis"], match["stat"] or "value", int(horizon) if horizon else None
+
+
+def _date_key(dates: pd.Series) -> np.ndarray:
+    # yyyymmdd integer, the usual Power BI date key
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).to_numpy(dtype=np.int32)
+
+
+def _metric_values(df: pd.DataFrame):
+    """
+    Metric names in input-file order and their (rows, metrics) values, with a
+    `{pe_type}_z_{h}y` z-score column after the input metrics wherever the
+    avg and std columns exist (same formula as compute_pe_z_scores).
+    """
+    names = [c for c in df.columns if parse_metric(c) is not None]
+    values = [pd.to_numeric(df[c]).to_numpy(dtype=float) for c in names]
+
+    avg, std = _stat_cube(df, "avg"), _stat_cube(df, "std")
+    for i, pe_type in enumerate(PE_TYPES):
+        for j, h in enumerate(HORIZONS):
+            if pe_type not in df.columns or f"{pe_type}_avg_{h}y" not in df.columns or f"{pe_type}_std_{h}y" not in df.columns:
+                continue
+            current = pd.to_numeric(df[pe_type]).to_numpy(dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = np.where(std[:, i, j] != 0, (current - avg[:, i, j]) / std[:, i, j], np.nan)
+            names.append(f"{pe_type}_z_{h}y")
+            values.append(z)
+
+    return names, np.column_stack(values) if values else np.empty((len(df), 0))
+
+
+def _dim_metric(names) -> pd.DataFrame:
+    mapping = get_field_mapping()
+    parsed = [parse_metric(name) for name in names]
+
+    def display(name, measure, basis, stat, horizon):
+        if stat == "z":
+            base = f"{measure}_{basis}"
+            return f"{mapping.get(base, base)} Z-Score {horizon}Y"
+        return mapping.get(name, name)
+
+    return pd.DataFrame({
+        "metric_key": np.arange(1, len(names) + 1, dtype=np.int16),
+        "Metric": names,
+        "Display Name": [display(name, *p) for name, p in zip(names, parsed)],
+        "Measure": [p[0] for p in parsed],
+        "Basis": [p[1] for p in parsed],
+        "Stat": [p[2] for p in parsed],
+        "Horizon (Y)": pd.array([p[3] for p in parsed], dtype="Int16"),
+    })
+
+
+def build_star_schema(
+    df: pd.DataFrame,
+    bases=VALUATION_BASES,
+    sensitivity_bases=SENSITIVITY_BASES,
+    eps_grid=CROSS_BASIS_EPS_RANGE,
+    pe_grid=CROSS_BASIS_PE_RANGE,
+    rate_grid=RATE_CHANGE_RANGE_BPS,
+    offsets=GRIDS["pe_sensitivity"]
+) -> dict:
+    """
+    Normalized (star-schema) form of the long format, z-score, P/E sensitivity
+    and cross-basis outputs, as {table name: DataFrame} in TABLES order.
+
+    Dimensions: dim_benchmark, dim_date (yyyymmdd date_key), dim_basis,
+    dim_metric (every input metric column parsed into measure/basis/stat/
+    horizon, plus the z-scores), dim_scenario (EPS × P/E steps of the
+    cross-basis grid, with the implied return, which depends on the step
+    only) and dim_rate_shock. Facts hold integer keys and float values only:
+    fact_baseline has one row per benchmark × date × basis with a usable EPS
+    and P/E (baseline_key, the current EPS/PE/index level/rate), and
+    fact_cross_basis and fact_pe_sensitivity refer to it by baseline_key.
+    Rate shocks do not change the implied index level, so the rates grid is
+    fact_cross_basis × dim_rate_shock (Adjusted Interest Rate = Current
+    Interest Rate + bps / 100) instead of 17 copies of every row.
+    """
+    missing = [c for c in ["benchmark_id", "date"] + [f"{k}_{b}" for b in bases for k in ("eps", "pe")]
+               if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+    unknown = [b for b in sensitivity_bases if b not in bases]
+    if unknown:
+        raise ValueError(f"Sensitivity bases {unknown} are not among the star-schema bases {list(bases)}")
+
+    benchmark_codes, benchmarks = pd.factorize(df["benchmark_id"], sort=True)
+    benchmark_key = (benchmark_codes + 1).astype(np.int32)
+    dates = pd.to_datetime(df["date"])
+    date_key = _date_key(dates)
+    unique_dates = pd.Series(pd.to_datetime(dates.unique())).sort_values(ignore_index=True)
+
+    tables = {
+        "dim_benchmark": pd.DataFrame({
+            "benchmark_key": np.arange(1, len(benchmarks) + 1, dtype=np.int32),
+            "Benchmark": np.asarray(benchmarks, dtype=object),
+        }),
+        "dim_date": pd.DataFrame({
+            "date_key": _date_key(unique_dates),
+            "Date": unique_dates,
+            "Year": unique_dates.dt.year.to_numpy(dtype=np.int16),
+            "Quarter": unique_dates.dt.quarter.to_numpy(dtype=np.int8),
+            "Month": unique_dates.dt.month.to_numpy(dtype=np.int8),
+        }),
+        "dim_basis": pd.DataFrame({
+            "basis_key": np.arange(1, len(bases) + 1, dtype=np.int8),
+            "Basis": np.asarray(bases, dtype=object),
+        }),
+    }
+
+    names, values = _metric_values(df)
+    tables["dim_metric"] = _dim_metric(names)
+
+    eps_grid = np.asarray(eps_grid)
+    pe_grid = np.asarray(pe_grid)
+    rate_grid = np.asarray(rate_grid)
+    multiplier = ((1 + eps_grid)[:, None] * (1 + pe_grid)[None, :]).ravel()
+    tables["dim_scenario"] = pd.DataFrame({
+        "scenario_key": np.arange(1, len(multiplier) + 1, dtype=np.int16),
+        "EPS Change (%)": np.repeat(to_percent(eps_grid), len(pe_grid)),
+        "PE Change (%)": np.tile(to_percent(pe_grid), len(eps_grid)),
+        "Implied Return (%)": (multiplier - 1) * 100,
+    })
+    tables["dim_rate_shock"] = pd.DataFrame({
+        "rate_key": np.arange(1, len(rate_grid) + 1, dtype=np.int16),
+        "Interest Rate Change (bps)": rate_grid,
+    })
+
+    # Baselines: one key per (row, basis) with a usable EPS and P/E, in row → basis order
+    eps = np.column_stack([pd.to_numeric(df[f"eps_{b}"]).to_numpy(dtype=float) for b in bases])
+    pe = np.column_stack([pd.to_numeric(df[f"pe_{b}"]).to_numpy(dtype=float) for b in bases])
+    present = ~np.isnan(eps) & ~np.isnan(pe)
+    row_idx, basis_idx = np.nonzero(present)
+    baseline_key = np.zeros(present.shape, dtype=np.int32)
+    baseline_key[row_idx, basis_idx] = np.arange(1, len(row_idx) + 1)
+    rate = (pd.to_numeric(df["current_interest_rate"]).to_numpy(dtype=float)
+            if "current_interest_rate" in df.columns else np.full(len(df), np.nan))
+    tables["fact_baseline"] = pd.DataFrame({
+        "baseline_key": baseline_key[row_idx, basis_idx],
+        "benchmark_key": benchmark_key[row_idx],
+        "date_key": date_key[row_idx],
+        "basis_key": (basis_idx + 1).astype(np.int8),
+        "Current EPS": eps[row_idx, basis_idx],
+        "Current PE": pe[row_idx, basis_idx],
+        "Current Index Level": eps[row_idx, basis_idx] * pe[row_idx, basis_idx],
+        "Current Interest Rate": rate[row_idx],
+    })
+
+    # np.nonzero walks row-major, so facts stay in row → metric order and NaNs are dropped
+    value_row, metric_idx = np.nonzero(~np.isnan(values))
+    tables["fact_metrics"] = pd.DataFrame({
+        "benchmark_key": benchmark_key[value_row],
+        "date_key": date_key[value_row],
+        "metric_key": (metric_idx + 1).astype(np.int16),
+        "Value": values[value_row, metric_idx],
+    })
+
+    # Cross-basis grid over the baselines with positive EPS and P/E, as in cross_basis_scenarios
+    with np.errstate(invalid="ignore"):
+        valid = present & (eps > 0) & (pe > 0)
+    grid_row, grid_basis = np.nonzero(valid)
+    adj_eps = eps[grid_row, grid_basis][:, None] * (1 + eps_grid)
+    adj_pe = pe[grid_row, grid_basis][:, None] * (1 + pe_grid)
+    tables["fact_cross_basis"] = pd.DataFrame({
+        "baseline_key": np.repeat(baseline_key[grid_row, grid_basis], len(multiplier)),
+        "scenario_key": np.tile(tables["dim_scenario"]["scenario_key"].to_numpy(), len(grid_row)),
+        "Implied Index Level": (adj_eps[:, :, None] * adj_pe[:, None, :]).ravel(),
+    })
+
+    # Sensitivity bases map onto the star-schema basis columns
+    grid = _sensitivity_grid(df, sensitivity_bases, offsets)
+    basis_pos = np.asarray([list(bases).index(b) for b in sensitivity_bases], dtype=np.intp)
+    tables["fact_pe_sensitivity"] = pd.DataFrame({
+        "baseline_key": baseline_key[grid["row"], basis_pos[grid["basis"]]],
+        "PE Scenario": grid["pe_scenario"].astype(np.int32),
+        "Implied Index Level": grid["implied_price"],
+        "Implied Return (%)": grid["implied_return"],
+    })
+    return tables
@@ -1,8 +1,109 @@
 
 from utils.aliases import get_field_mapping
+from utils.grids import GRIDS
 import numpy as np
 import pandas as pd
 
+def _sensitivity_grid(df: pd.DataFrame, bases, offsets) -> dict:
+    """
+    Arrays behind pe_sensitivity, one entry per benchmark × basis × P/E
+    scenario, plus the input row ("row") and basis index ("basis") of each.
+    """
+    mapping = get_field_mapping()
+
+    def resolve(raw):
+        # Accepts either display (renamed) or raw column names
+        display = mapping.get(raw, raw)
+        return display if display in df.columns else raw
+
+    benchmark_col = resolve("benchmark_id")
+    missing = [c for c in [benchmark_col] + [resolve(f"{k}_{b}") for b in bases for k in ("eps", "pe")]
+               if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+
+    eps = np.column_stack([pd.to_numeric(df[resolve(f"eps_{b}")]).to_numpy(dtype=float) for b in bases])
+    current_pe = np.column_stack([pd.to_numeric(df[resolve(f"pe_{b}")]).to_numpy(dtype=float) for b in bases])
+
+    row_idx, basis_idx = np.nonzero(~np.isnan(eps) & ~np.isnan(current_pe))
+    eps = eps[row_idx, basis_idx]
+    current_pe = current_pe[row_idx, basis_idx]
+    current_price = eps * current_pe
+
+    # Ragged per-benchmark grids: a fixed offset grid around int(pe), then mask out P/E <= 0
+    pe_grid = np.trunc(current_pe).astype(np.int64)[:, None] + np.asarray(offsets, dtype=np.int64)
+    keep = pe_grid > 0
+    owner = np.nonzero(keep)[0]
+    pe_scenario = pe_grid[keep]
+
+    implied_price = eps[owner] * pe_scenario
+    with np.errstate(divide="ignore", invalid="ignore"):
+        implied_return = np.where(current_price[owner] != 0, (implied_price / current_price[owner]) - 1, np.nan)
+
+    return {
+        "row": row_idx[owner],
+        "basis": basis_idx[owner],
+        "benchmark": df[benchmark_col].to_numpy(dtype=object)[row_idx][owner],
+        "eps": eps[owner],
+        "current_pe": current_pe[owner],
+        "current_price": current_price[owner],
+        "pe_scenario": pe_scenario,
+        "implied_price": implied_price,
+        "implied_return": implied_return * 100,
+    }
+
+
+def pe_sensitivity(
+    df: pd.DataFrame,
+    bases=("trailing",),
+    offsets=GRIDS["pe_sensitivity"]
+) -> pd.DataFrame:
+    """
+    Single vectorized kernel behind the wide and stacked P/E sensitivity tables.
+
+    For every benchmark and valuation basis, builds the integer P/E grid
+    int(current_pe) + `offsets` (integer P/E points, ±50 by default from the
+    "pe_sensitivity" grid; non-positive P/Es dropped) and the implied
+    index level and return at each point. Rows with a missing EPS or P/E are
+    skipped. Returns one long row per benchmark × basis × P/E scenario, ordered
+    benchmark → basis → P/E; the wide and stacked tables are column selections
+    and reshapes of this frame.
+    """
+    grid = _sensitivity_grid(df, bases, offsets)
+    return pd.DataFrame({
+        "Benchmark": grid["benchmark"],
+        "EPS Type": np.asarray(bases, dtype=object)[grid["basis"]],
+        "Current EPS": grid["eps"],
+        "Current PE": grid["current_pe"],
+        "Current Index Level": grid["current_price"],
+        "PE Scenario": grid["pe_scenario"],
+        "Implied Index Level": grid["implied_price"],
+        "Implied Return (%)": grid["implied_return"]
+    })
+
+
+def wide_pe_sensitivity(sensitivity: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (returns, prices) tables from a pe_sensitivity result.
+    """
+    keys = ["Benchmark", "EPS Type", "Current EPS", "Current PE", "PE Scenario"]
+    return sensitivity[keys + ["Implied Return (%)"]], sensitivity[keys + ["Implied Index Level"]]
+
+
+def stack_pe_sensitivity(sensitivity: pd.DataFrame) -> pd.DataFrame:
+    """
+    Long-skinny table from a pe_sensitivity result: each P/E scenario becomes an
+    "Implied Index Level" row followed by an "Implied Return (%)" row.
+    """
+    keys = ["Benchmark", "EPS Type", "Current EPS", "Current PE", "Current Index Level", "PE Scenario"]
+    metrics = ["Implied Index Level", "Implied Return (%)"]
+
+    stacked = {col: np.repeat(sensitivity[col].to_numpy(), len(metrics)) for col in keys}
+    stacked["Value"] = np.column_stack([sensitivity[m].to_numpy() for m in metrics]).ravel()
+    stacked["MetricType"] = np.tile(np.asarray(metrics, dtype=object), len(sensitivity))
+    return pd.DataFrame(stacked)
+
+
 def generate_stacked_pe_sensitivity(
     df: pd.DataFrame,
     valuation_basis: str = "trailing"
@@ -12,56 +113,9 @@ def generate_stacked_pe_sensitivity(
     from P/E ratio scenarios using a specified EPS type (trailing, fwd_1y, fwd_2y).
     Adds columns: 'MetricType', 'Value', and 'Current Index Level'.
     """
+    return stack_pe_sensitivity(pe_sensitivity(df, bases=[valuation_basis]))
+
 
-    mapping = get_field_mapping()
-    pe_col = mapping.get(f"pe_{valuation_basis}", f"pe_{valuation_basis}")
-    eps_col = mapping.get(f"eps_{valuation_basis}", f"eps_{valuation_basis}")
-    benchmark_col = mapping.get("benchmark_id", "benchmark_id")
-
-    rows = []
-
-    for _, row in df.iterrows():
-        benchmark = row.get(benchmark_col)
-        eps = row.get(eps_col)
-        current_pe = row.get(pe_col)
-
-        if pd.isna(eps) or pd.isna(current_pe):
-            continue
-
-        current_price = eps * current_pe
-        pe_range = np.arange(int(current_pe) - 50, int(current_pe) + 51, 1)
-
-        for pe in pe_range:
-            if pe <= 0:
-                continue  # skip invalid P/E values
-
-            implied_price = eps * pe
-            implied_return = (implied_price / current_price) - 1 if current_price else None
-
-            rows.append({
-                "Benchmark": benchmark,
-                "EPS Type": valuation_basis,
-                "Current EPS": eps,
-                "Current PE": current_pe,
-                "Current Index Level": current_price,
-                "PE Scenario": pe,
-                "Value": implied_price,
-                "MetricType": "Implied Index Level"
-            })
-
-            rows.append({
-                "Benchmark": benchmark,
-                "EPS Type": valuation_basis,
-                "Current EPS": eps,
-                "Current PE": current_pe,
-                "Current Index Level": current_price,
-                "PE Scenario": pe,
-                "Value": implied_return * 100 if implied_return is not None else None,
-                "MetricType": "Implied Return (%)"
-            })
-
-    result = pd.DataFrame(rows)
-    return result
 def generate_wide_custom_pe_sensitivity(
     df: pd.DataFrame,
     valuation_basis: str = "trailing"
@@ -70,76 +124,37 @@ def generate_wide_custom_pe_sensitivity(
     Generate long-format sensitivity matrices around each benchmark's current P/E ratio,
     using a dynamic valuation basis: 'trailing', 'fwd_1y', 'fwd_2y'.
     """
-    result_returns = []
-    result_prices = []
-
-    mapping = get_field_mapping()
-    pe_col = mapping.get(f"pe_{valuation_basis}", f"pe_{valuation_basis}")
-    print(pe_col)
-    eps_col = mapping.get(f"eps_{valuation_basis}", f"eps_{valuation_basis}")
-    benchmark_col = mapping.get("benchmark_id", "benchmark_id")
-
-    for _, row in df.iterrows():
-        benchmark = row.get(benchmark_col)
-        eps = row.get(eps_col)
-        current_pe = row.get(pe_col)
-        print(eps)
-        if pd.isna(eps) or pd.isna(current_pe):
-            continue
-
-        current_price = eps * current_pe
-        pe_range = np.arange(int(current_pe) - 50, int(current_pe) + 51, 1)
-        print(current_price, pe_range)
-        for pe in pe_range:
-            if pe <= 0:
-                continue  # Skip invalid P/E values
-
-            implied_price = eps * pe
-            implied_return = (implied_price / current_price) - 1 if current_price else None
-
-            result_returns.append({
-                "Benchmark": benchmark,
-                "EPS Type": valuation_basis,
-                "Current EPS": eps,
-                "Current PE": current_pe,
-                "PE Scenario": pe,
-                "Implied Return (%)": implied_return * 100 if implied_return is not None else None
-            })
-
-            result_prices.append({
-                "Benchmark": benchmark,
-                "EPS Type": valuation_basis,
-                "Current EPS": eps,
-                "Current PE": current_pe,
-                "PE Scenario": pe,
-                "Implied Index Level": implied_price
-            })
-
-    df_returns = pd.DataFrame(result_returns)
-    df_prices = pd.DataFrame(result_prices)
-
-    return df_returns, df_prices
+    return wide_pe_sensitivity(pe_sensitivity(df, bases=[valuation_basis]))
 
 
 def melt_pe_eps(df):
-    FIELD_NAME_MAP = get_field_mapping()
+    """
+    Long format (Date, Benchmark, Metric, Value) of the P/E and EPS columns,
+    with display names. Takes raw or display column names and builds the
+    output straight from the input columns, without renaming `df` first.
+    """
+    mapping = get_field_mapping()
 
-    id_vars = [
-        FIELD_NAME_MAP.get("date", "date"),
-        FIELD_NAME_MAP.get("benchmark_id", "benchmark_id")
-    ]
-    value_vars = [col for col in df.columns if any(p in col.lower() for p in ["pe", "eps"])]
+    def resolve(raw):
+        display = mapping.get(raw, raw)
+        return display if display in df.columns else raw
 
+    id_vars = [resolve("date"), resolve("benchmark_id")]
     missing = [col for col in id_vars if col not in df.columns]
     if missing:
         raise ValueError(f"Missing ID columns in melt_pe_eps: {missing}")
 
-    return df.melt(
-        id_vars=id_vars,
-        value_vars=value_vars,
-        var_name="Metric",
-        value_name="Value"
-    )
+    # Metrics are selected on their display names, as the long table has always been
+    metrics = [(col, mapping.get(col, col)) for col in df.columns]
+    metrics = [(col, name) for col, name in metrics if any(p in name.lower() for p in ["pe", "eps"])]
+
+    n = len(df)
+    return pd.DataFrame({
+        mapping.get("date", "date"): np.tile(df[id_vars[0]].to_numpy(), len(metrics)),
+        mapping.get("benchmark_id", "benchmark_id"): np.tile(df[id_vars[1]].to_numpy(), len(metrics)),
+        "Metric": np.repeat(np.asarray([name for _, name in metrics], dtype=object), n),
+        "Value": np.concatenate([df[col].to_numpy() for col, _ in metrics]) if metrics else np.array([], dtype=float),
+    })
 
 
 def pivot_to_matrix(df: pd.DataFrame, value_type="eps", horizon="1y") -> pd.DataFrame:
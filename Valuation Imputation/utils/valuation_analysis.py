@@ -1,17 +1,42 @@
 import pandas as pd
 
-def calculate_price_impact(df: pd.DataFrame, valuation_basis: str = "trailing") -> pd.DataFrame:
+def calculate_price_impact(
+    df: pd.DataFrame,
+    valuation_basis: str = "trailing",
+    panel: bool = False,
+    window: int | None = None,
+    base_price: float | None = None
+) -> pd.DataFrame:
+    """
+    Implied price (EPS × P/E) and return versus a base price.
+
+    By default every row is anchored to the first available implied price of
+    the whole frame. With `panel=True` the frame is treated as a date ×
+    benchmark panel: rows are sorted by (benchmark_id, date) and each
+    benchmark is anchored to its own first available price. Panel mode also
+    adds the one-period `Period_Return` and, when `window` is given, a
+    `Rolling_Return_{window}` over that many observations. All panel columns
+    are computed with grouped vectorized operations, never per-group copies.
+
+    `base_price` overrides the anchor in the default mode, e.g. to carry the
+    first chunk's base price through a chunked run.
+    """
     eps_col = f"eps_{valuation_basis}"
     pe_col = f"pe_{valuation_basis}"
 
     if eps_col not in df.columns or pe_col not in df.columns:
         raise KeyError(f"Missing required columns: {eps_col} or {pe_col}")
 
-    df = df.copy()
+    if panel:
+        return _calculate_panel_price_impact(df, eps_col, pe_col, window)
+
+    # New columns go on a shallow copy: the input columns are shared, not duplicated
+    df = df.copy(deep=False)
     df["Implied_Price"] = df[eps_col] * df[pe_col]
 
-    if df["Implied_Price"].notna().any():
-        base_price = df["Implied_Price"].dropna().iloc[0]
+    if base_price is not None or df["Implied_Price"].notna().any():
+        if base_price is None:
+            base_price = df["Implied_Price"].dropna().iloc[0]
         df["Base_Price"] = base_price
         df["Implied_Return"] = df["Implied_Price"] / base_price - 1
     else:
@@ -21,8 +46,29 @@ def calculate_price_impact(df: pd.DataFrame, valuation_basis: str = "trailing")
     return df
 
 
-def create_return_matrix(df):
+def _calculate_panel_price_impact(df, eps_col, pe_col, window):
+    missing = [c for c in ["benchmark_id", "date"] if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+
+    # One stable sort up front; every grouped op below then runs over contiguous blocks
+    df = df.sort_values(["benchmark_id", "date"], kind="stable", ignore_index=True)
+    price = df[eps_col] * df[pe_col]
+    grouped = price.groupby(df["benchmark_id"], sort=False)
+
+    df["Implied_Price"] = price
+    df["Base_Price"] = grouped.transform("first")  # first non-null price per benchmark
+    df["Implied_Return"] = price / df["Base_Price"] - 1
+    df["Period_Return"] = price / grouped.shift(1) - 1
+    if window:
+        df[f"Rolling_Return_{window}"] = price / grouped.shift(window) - 1
+
+    return df
+
+
+def create_return_matrix(df, values="Implied_Return"):
     """
     Pivot implied return into a matrix: benchmark_id × date
+    Pass `values` to pivot another return column (e.g. Period_Return) from a panel.
     """
-    return df.pivot(index="benchmark_id", columns="date", values="Implied_Return")
+    return df.pivot(index="benchmark_id", columns="date", values=values)
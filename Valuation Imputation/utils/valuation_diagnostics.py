@@ -1,29 +1,53 @@
+import numpy as np
 import pandas as pd
 
+HORIZONS = ["1", "3", "5", "7", "10", "15", "20"]
+PE_TYPES = ["pe_trailing", "pe_fwd_1y", "pe_fwd_2y"]
+
+
+def _stat_cube(df: pd.DataFrame, stat: str) -> np.ndarray:
+    """
+    Stack the `{pe_type}_{stat}_{h}y` columns into a (benchmark, pe_type, horizon)
+    float array. Columns missing from `df` come back as NaN, i.e. skipped cells.
+    """
+    cube = np.full((len(df), len(PE_TYPES), len(HORIZONS)), np.nan)
+    for i, pe_type in enumerate(PE_TYPES):
+        for j, h in enumerate(HORIZONS):
+            col = f"{pe_type}_{stat}_{h}y"
+            if col in df.columns:
+                cube[:, i, j] = pd.to_numeric(df[col]).to_numpy(dtype=float)
+    return cube
+
+
 def compute_pe_z_scores(df: pd.DataFrame) -> pd.DataFrame:
-    horizons = ["1", "3", "5", "7", "10", "15", "20"]
-    pe_types = ["pe_trailing", "pe_fwd_1y", "pe_fwd_2y"]
-
-    output = []
-
-    for _, row in df.iterrows():
-        for pe_type in pe_types:
-            current_val = row[pe_type]
-            for h in horizons:
-                avg_col = f"{pe_type}_avg_{h}y"
-                std_col = f"{pe_type}_std_{h}y"
-
-                if avg_col in row and std_col in row and pd.notna(row[avg_col]) and pd.notna(row[std_col]):
-                    z = (current_val - row[avg_col]) / row[std_col] if row[std_col] != 0 else None
-                    output.append({
-                        "Benchmark": row["benchmark_id"],
-                        "Date": row["date"],
-                        "PE_Type": pe_type,
-                        "Horizon": h,
-                        "Current_Value": current_val,
-                        "Avg_Value": row[avg_col],
-                        "Std_Dev": row[std_col],
-                        "Z_Score": z
-                    })
-
-    return pd.DataFrame(output)
+    """
+    Z-score of each current P/E against its rolling average / std for every
+    PE type and horizon. Cells whose avg or std is missing are dropped; a zero
+    std gives a missing Z_Score. Rows are ordered benchmark → pe_type → horizon.
+    """
+    missing = [c for c in ["benchmark_id", "date"] + PE_TYPES if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+
+    current = np.column_stack([pd.to_numeric(df[c]).to_numpy(dtype=float) for c in PE_TYPES])
+    avg = _stat_cube(df, "avg")
+    std = _stat_cube(df, "std")
+
+    current = np.broadcast_to(current[:, :, None], avg.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(std != 0, (current - avg) / std, np.nan)
+
+    # np.nonzero walks the mask row-major, keeping the benchmark → pe_type → horizon order
+    row_idx, type_idx, horizon_idx = np.nonzero(~np.isnan(avg) & ~np.isnan(std))
+    cells = (row_idx, type_idx, horizon_idx)
+
+    return pd.DataFrame({
+        "Benchmark": df["benchmark_id"].to_numpy()[row_idx],
+        "Date": df["date"].to_numpy()[row_idx],
+        "PE_Type": np.asarray(PE_TYPES, dtype=object)[type_idx],
+        "Horizon": np.asarray(HORIZONS, dtype=object)[horizon_idx],
+        "Current_Value": current[cells],
+        "Avg_Value": avg[cells],
+        "Std_Dev": std[cells],
+        "Z_Score": z[cells]
+    })